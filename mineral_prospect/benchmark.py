@@ -0,0 +1,356 @@
+"""Benchmarks of the optimization, training and scoring hot paths
+
+Every benchmark runs at several training set sizes, on synthetic mines generated with a fixed seed
+from the copper training set (``synthetic.SyntheticMines``). The results are written as JSON to ``reports/benchmarks`` together
+with the commit, the machine and the library versions, so runs of different commits can be
+compared::
+
+    python -m mineral_prospect.benchmark run --sizes 1000 10000
+    python -m mineral_prospect.benchmark compare reports/benchmarks/A.json reports/benchmarks/B.json
+
+The objectives, preprocessors and samplers are imported from the optimization scripts in
+``SCRIPTS_DIR``. Trials run in this process with a seeded ``RandomSampler``: the scripts' TPE
+samplers also sample at random for their first 100 trials.
+"""
+
+import argparse
+import importlib
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import optuna
+import pandas as pd
+from imblearn.pipeline import Pipeline as ImbPipeline
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+
+from mineral_prospect.config import MIN_TIR, PROJ_ROOT, REPORTS_DIR
+from mineral_prospect.modeling.artifact import library_versions
+from mineral_prospect.modeling.compiled import CompiledPipeline
+from mineral_prospect.modeling.importance import importance_experiment
+from mineral_prospect.modeling.predict import ProspectScorer
+from mineral_prospect.modeling.profiling import profile_report
+from mineral_prospect.modeling.staged import GROWN_FROM_ATTR
+from mineral_prospect.synthetic import load_synthetic
+
+SCRIPTS_DIR = PROJ_ROOT / "notebooks" / "ian" / "copper" / "modeling" / "tree_models"
+BENCHMARKS_DIR = REPORTS_DIR / "benchmarks"
+
+OBJECTIVES = ("decision_tree", "random_forest", "xgboost")
+PREPROCESSORS = ("FEAT_SEL_PRE", "MODEL_PRE")
+
+
+def synthetic_training_set(n_rows, seed=0):
+    """``n_rows`` synthetic mines like ``X_train`` / ``y_train_cat``"""
+
+    X, y = load_synthetic().sample(n_rows, seed)
+
+    return X, y < MIN_TIR
+
+
+def _best_of(repeats, function, *args):
+
+    times = []
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+
+    return min(times), result
+
+
+############################ BENCHMARKS ############################
+
+
+def bench_objectives(X, y, settings, n_trials=20, seed=0):
+    """Trials per minute of the ``*_optm.py`` objectives, one process, in-memory study"""
+
+    results = {}
+
+    for name in OBJECTIVES:
+
+        module = importlib.import_module(f"{name}_optm")
+
+        start = time.perf_counter()
+        objective = module.make_objective(X, y, cache_dir=None, oof_dir=None)
+        setup_s = time.perf_counter() - start
+
+        study = optuna.create_study(
+            directions=["maximize", "minimize"], sampler=optuna.samplers.RandomSampler(seed)
+        )
+
+        start = time.perf_counter()
+        study.optimize(objective, n_trials=n_trials)
+        elapsed = time.perf_counter() - start
+
+        sampled = [trial for trial in study.trials if GROWN_FROM_ATTR not in trial.user_attrs]
+        states = pd.Series([trial.state.name for trial in sampled], dtype=object).value_counts()
+        stages = profile_report(study)
+
+        results[name] = {
+            # Folds preprocessed and resampled once, before the first trial
+            "setup_s": setup_s,
+            "trials": n_trials,
+            "trials_per_minute": 60 * n_trials / elapsed,
+            "complete": int(states.get("COMPLETE", 0)),
+            "pruned": int(states.get("PRUNED", 0)),
+            # Prefix sizes of the ensembles, scored without refitting (staged.add_size_trials)
+            "added_trials": len(study.trials) - len(sampled),
+            "stage_wall_s": stages["wall_s"].to_dict() if not stages.empty else {},
+        }
+
+    return results
+
+
+def bench_preprocessors(X, y, settings, repeats=3):
+    """Fit and transform seconds of the preprocessors"""
+
+    results = {}
+
+    for name in PREPROCESSORS:
+
+        preprocessor = getattr(settings, name)
+
+        fit_s, fitted = _best_of(repeats, lambda: clone(preprocessor).fit(X, y))
+        transform_s, _ = _best_of(repeats, fitted.transform, X)
+
+        results[name] = {
+            "fit_s": fit_s,
+            "transform_s": transform_s,
+            "transform_rows_per_s": len(X) / transform_s,
+        }
+
+    return results
+
+
+def bench_resampling(X, y, settings, repeats=3, seed=0):
+    """SMOTE and RandomUnderSampler seconds on the preprocessed training set"""
+
+    X = clone(settings.FEAT_SEL_PRE).fit_transform(X, y)
+    y = np.asarray(y).ravel()
+
+    over = clone(settings.OVER).set_params(random_state=seed)
+    under = clone(settings.UNDER).set_params(random_state=seed)
+
+    smote_s, (X_over, y_over) = _best_of(repeats, over.fit_resample, X, y)
+    under_s, (X_under, _) = _best_of(repeats, under.fit_resample, X_over, y_over)
+
+    return {
+        "SMOTE": {"s": smote_s, "rows_out": len(X_over)},
+        "RandomUnderSampler": {"s": under_s, "rows_out": len(X_under)},
+    }
+
+
+def bench_importance(X, y, settings, n_shards=32, seed=0):
+    """Bootstrap importance shards per second, ``importance_experiment`` with both backends"""
+
+    X = clone(settings.FEAT_SEL_PRE).fit_transform(X, y)
+    y = np.asarray(y).ravel()
+
+    rng = np.random.default_rng(seed)
+    shards = [rng.integers(len(X), size=len(X)) for _ in range(n_shards)]
+
+    X_list = [X[rows] for rows in shards]
+    y_list = [y[rows] for rows in shards]
+
+    pipe = ImbPipeline([("classifier", DecisionTreeClassifier(random_state=seed))])
+
+    results = {}
+
+    for backend in ("processes", "threads"):
+        start = time.perf_counter()
+        importance_experiment(X_list, y_list, pipe, backend=backend, progress=False)
+        elapsed = time.perf_counter() - start
+
+        results[backend] = {"shards": n_shards, "shards_per_s": n_shards / elapsed}
+
+    return results
+
+
+def bench_scoring(X, y, settings, repeats=3, seed=0):
+    """Rows per second of ``ProspectScorer`` with the fitted and the compiled pipeline"""
+
+    model = ImbPipeline(
+        [
+            ("preprocessor", clone(settings.MODEL_PRE)),
+            ("over", clone(settings.OVER).set_params(random_state=seed)),
+            ("under", clone(settings.UNDER).set_params(random_state=seed)),
+            (
+                "classifier",
+                RandomForestClassifier(n_estimators=100, max_depth=6, random_state=seed),
+            ),
+        ]
+    ).fit(X, np.asarray(y).ravel())
+
+    results = {}
+
+    for name, scorer in (
+        ("pipeline", ProspectScorer(model)),
+        ("compiled", ProspectScorer(CompiledPipeline.from_pipeline(model))),
+    ):
+        seconds, _ = _best_of(repeats, scorer.score, X)
+        results[name] = {"rows_per_s": len(X) / seconds}
+
+    return results
+
+
+BENCHMARKS = {
+    "objectives": bench_objectives,
+    "preprocessors": bench_preprocessors,
+    "resampling": bench_resampling,
+    "importance": bench_importance,
+    "scoring": bench_scoring,
+}
+
+
+############################ RUNS ############################
+
+
+def _git(*args):
+
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=PROJ_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Commit, machine and library versions of a run"""
+
+    status = _git("status", "--porcelain", "--untracked-files=no")
+
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "libraries": library_versions(),
+    }
+
+
+def run(sizes, benchmarks=tuple(BENCHMARKS), n_trials=20, seed=0, scripts_dir=SCRIPTS_DIR):
+    """Runs ``benchmarks`` at every size and returns the results with their environment"""
+
+    # The scripts import their own settings, constants and optuna_functions modules
+    sys.path.insert(0, str(scripts_dir))
+    settings = importlib.import_module("settings")
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    options = {"n_trials": n_trials, "seed": seed}
+    results = []
+
+    for n_rows in sizes:
+
+        X, y = synthetic_training_set(n_rows, seed)
+
+        for benchmark in benchmarks:
+
+            function = BENCHMARKS[benchmark]
+            accepted = inspect.signature(function).parameters
+            kwargs = {key: value for key, value in options.items() if key in accepted}
+
+            start = time.perf_counter()
+            measured = function(X, y, settings, **kwargs)
+
+            print(f"{benchmark} at {n_rows} rows: {time.perf_counter() - start:.1f} s")
+
+            results.extend(
+                {"benchmark": benchmark, "name": name, "rows": n_rows, "metrics": metrics}
+                for name, metrics in measured.items()
+            )
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "parameters": {"sizes": list(sizes), "n_trials": n_trials, "seed": seed},
+        "results": results,
+    }
+
+
+def save(report, output_dir=BENCHMARKS_DIR):
+    """Writes ``report`` as ``<output_dir>/<UTC time>_<commit>.json`` and returns the path"""
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    stamp = datetime.fromisoformat(report["created"]).strftime("%Y%m%dT%H%M%S")
+    commit = (report["environment"]["commit"] or "nogit")[:10]
+
+    path = output_dir / f"{stamp}_{commit}.json"
+    path.write_text(json.dumps(report, indent=2))
+
+    return path
+
+
+def compare(baseline, candidate):
+    """Numeric metrics of two saved reports side by side, with ``candidate / baseline``"""
+
+    def flatten(path):
+        report = json.loads(Path(path).read_text())
+        return {
+            (result["benchmark"], result["name"], result["rows"], metric): value
+            for result in report["results"]
+            for metric, value in result["metrics"].items()
+            if isinstance(value, (int, float))
+        }
+
+    before, after = flatten(baseline), flatten(candidate)
+
+    rows = [
+        (*key, before[key], after[key], after[key] / before[key] if before[key] else np.nan)
+        for key in sorted(before.keys() & after.keys())
+    ]
+
+    return pd.DataFrame(
+        rows, columns=["benchmark", "name", "rows", "metric", "baseline", "candidate", "ratio"]
+    )
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Performance benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and save a JSON report")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    run_parser.add_argument(
+        "--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS)
+    )
+    run_parser.add_argument("--trials", type=int, default=20, help="trials per objective")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--scripts-dir", type=Path, default=SCRIPTS_DIR)
+    run_parser.add_argument("--output-dir", type=Path, default=BENCHMARKS_DIR)
+
+    compare_parser = commands.add_parser("compare", help="compare two saved reports")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("candidate", type=Path)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run(args.sizes, args.only, args.trials, args.seed, args.scripts_dir)
+        print(save(report, args.output_dir))
+
+    else:
+        with pd.option_context(
+            "display.max_rows", None, "display.max_columns", None, "display.width", 200
+        ):
+            print(compare(args.baseline, args.candidate).round(4))
+
+
+if __name__ == "__main__":
+    main()
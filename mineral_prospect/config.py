@@ -0,0 +1,100 @@
+"""Project paths and shared constants"""
+
+from pathlib import Path
+
+# Paths
+PROJ_ROOT = Path(__file__).resolve().parents[1]
+
+DATA_DIR = PROJ_ROOT / "data"
+RAW_DATA_DIR = DATA_DIR / "raw"
+INTERIM_DATA_DIR = DATA_DIR / "interim"
+PROCESSED_DATA_DIR = DATA_DIR / "processed"
+EXTERNAL_DATA_DIR = DATA_DIR / "external"
+
+MODELS_DIR = PROJ_ROOT / "models"
+
+REPORTS_DIR = PROJ_ROOT / "reports"
+FIGURES_DIR = REPORTS_DIR / "figures"
+
+COPPER_INTERIM_DIR = INTERIM_DATA_DIR / "copper"
+
+COPPER_RAW_PATH = RAW_DATA_DIR / "Cu_v2.xls"
+RAW_CACHE_DIR = INTERIM_DATA_DIR / "raw_cache"
+
+# Raw workbook columns and their names in the project
+RENAME_DICT = {
+    "Property Name": "PROPERTY_NM",
+    "Activity Status": "ACTIVITY_STATUS",
+    "Mine Type 1": "MINE_TYPE",
+    "Initial Capital Cost\r\n($M)": "INITIAL_COST",
+    "NPV Discount % - Base Case\r\n(%)": "NPV_DISCOUNT",
+    "Post-Tax IRR % - Base Case\r\n(%)": "TIR",
+    "Study Price per tonne - Base Case\r\n($/tonne)": "PRICE_PER_TONNE_MAIN_ORE",
+    "Geologic Ore Body Type": "GEOLOGIC_ORE_BODY_TYPE",
+    "Country / Region Name": "PLACE_NM",
+    "Reserves & Resources: Ore Tonnage\r\n(tonnes)": "ORE_TONNAGE",
+    "Grade, Reserves & Resources Copper\n(%)": "COPPER_GRADE",
+    "Grade, Reserves & Resources Lead\n(%)": "LEAD_GRADE",
+    "Grade, Reserves & Resources Zinc\n(%)": "ZINC_GRADE",
+    "Grade, Reserves & Resources Gold\n(g/tonne)": "GOLD_DENSITY",
+    "Grade, Reserves & Resources Silver\n(g/tonne)": "SILVER_DENSITY",
+    "Global Region": "GLOBAL_REGION",
+}
+
+# Grades of reservoirs with no ore tonnage are unknown rather than zero
+FILL_COLS = ["COPPER_GRADE", "LEAD_GRADE", "ZINC_GRADE", "GOLD_DENSITY", "SILVER_DENSITY"]
+
+# Projects with a post-tax IRR (%) below MIN_TIR are unpromising, the positive class
+MIN_TIR = 15
+
+# Training projects with an IRR above this are outliers
+UPPER_LIMIT_TIR = 125
+
+DROP_COLUMNS = ["PROPERTY_NM", "ACTIVITY_STATUS", "PLACE_NM", "NPV_DISCOUNT"]
+
+# Feature names used before the gold/silver amounts were renamed from tonnes to grams
+LEGACY_FEATURE_NAMES = {
+    "PRECIOUS_TONNAGE": "PRECIOUS_GRAMS",
+    "ECONOMIC_TONNAGE": "ECONOMIC_AMOUNT",
+    "GOLD_TONNAGE": "GOLD_GRAMS",
+    "SILVER_TONNAGE": "SILVER_GRAMS",
+    "INITIAL_COST_PER_TONNE": "INITIAL_COST_PER_AMOUNT",
+}
+LEGACY_FEATURE_NAMES.update(
+    {f"LOG_10_{old}": f"LOG_10_{new}" for old, new in LEGACY_FEATURE_NAMES.items()}
+)
+
+# Amounts derived from the grades and the ore tonnage, in the order they are computed
+DERIVED_FEATURES = [
+    "PRECIOUS_ORE_DENSITY",
+    "GOLD_GRAMS",
+    "SILVER_GRAMS",
+    "PRECIOUS_GRAMS",
+    "COPPER_TONNAGE",
+    "ECONOMIC_AMOUNT",
+    "INITIAL_COST_PER_AMOUNT",
+]
+
+TO_LOG10 = [
+    "GOLD_DENSITY",
+    "SILVER_DENSITY",
+    "PRECIOUS_ORE_DENSITY",
+    "COPPER_GRADE",
+    "INITIAL_COST",
+    "ORE_TONNAGE",
+    "PRECIOUS_GRAMS",
+    "COPPER_TONNAGE",
+    "ECONOMIC_AMOUNT",
+    "GOLD_GRAMS",
+    "SILVER_GRAMS",
+    "INITIAL_COST_PER_AMOUNT",
+]
+
+# log10(0) = -inf is replaced by this value
+LOG_INF_REPL = -100
+
+# Rare categories merged into a larger one, for balancing
+CATEGORY_GROUPS = {
+    "GEOLOGIC_ORE_BODY_TYPE": {"SKARN": "SKARN-SHD", "SHD": "SKARN-SHD"},
+    "MINE_TYPE": {"In-Situ Leach": "Open Pit", "Tailings": "Open Pit"},
+}
@@ -0,0 +1,268 @@
+"""Dataset building and loading"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from mineral_prospect.config import (
+    COPPER_INTERIM_DIR,
+    COPPER_RAW_PATH,
+    FILL_COLS,
+    LEGACY_FEATURE_NAMES,
+    RAW_CACHE_DIR,
+    RENAME_DICT,
+)
+
+################################## RAW WORKBOOK ##################################
+
+# Part of the cache key: bump it when ``read_raw_copper`` changes what it produces
+INGESTION_VERSION = 1
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of the content of ``path``"""
+
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def read_raw_copper(path=COPPER_RAW_PATH):
+    """Parses the raw workbook into the renamed, typed, cleaned project table.
+
+    Numeric columns are ``float64`` and text columns are strings. Reservoirs with no ore
+    tonnage get unknown tonnage and grades, and rows with no information at all are dropped.
+    """
+
+    df = pd.read_excel(path, decimal=",", thousands=".").rename(columns=RENAME_DICT)
+
+    numeric = df.select_dtypes("number").columns
+    df[numeric] = df[numeric].astype(np.float64)
+
+    df.loc[df["ORE_TONNAGE"] == 0, FILL_COLS] = np.nan
+    df["ORE_TONNAGE"] = df["ORE_TONNAGE"].replace(0, np.nan)
+
+    return df.dropna(how="all")
+
+
+def load_raw_copper(path=COPPER_RAW_PATH, cache_dir=RAW_CACHE_DIR):
+    """``read_raw_copper(path)``, cached as Parquet under the content hash of the workbook.
+
+    Only a new or changed workbook (or a new ``INGESTION_VERSION``) is parsed again; older
+    cache entries of the same workbook name are removed when a new one is written.
+    """
+
+    path = Path(path)
+    cache_dir = Path(cache_dir)
+
+    key = f"{file_hash(path)[:16]}-v{INGESTION_VERSION}"
+    cache_path = cache_dir / f"{path.stem}-{key}.parquet"
+
+    if cache_path.exists():
+        df = pd.read_parquet(cache_path)
+
+        # Parquet gives back the missing text values as None, ``read_raw_copper`` as NaN
+        text = df.select_dtypes("object").columns
+        df[text] = df[text].where(df[text].notna(), np.nan)
+
+        return df
+
+    df = read_raw_copper(path)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    for stale in cache_dir.glob(f"{path.stem}-*.parquet"):
+        stale.unlink()
+
+    # Written under a temporary name so concurrent readers never see a partial file
+    tmp_path = cache_dir / f"{cache_path.stem}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, cache_path)
+
+    return df
+
+
+############################## BALANCED BOOTSTRAP SHARDS ##############################
+
+# The 1,000 balanced samples of ``X_train_bal/`` and ``y_train_bal/`` consolidated into one
+# uncompressed Arrow IPC file. Rows are sorted by shard, features are stored row-major in a
+# fixed-size list column, so the whole matrix (or any shard) is a zero-copy view of the mapped
+# file. The manifest next to it keeps the feature names and the row offsets of every shard.
+SHARDS_PATH = COPPER_INTERIM_DIR / "train_bal.arrow"
+
+
+def manifest_path(path):
+
+    return Path(path).with_suffix(".json")
+
+
+def _shard_files(directory, prefix):
+
+    files = {}
+
+    for file in Path(directory).glob(f"{prefix}_*.parquet"):
+        match = re.fullmatch(rf"{prefix}_(\d+)\.parquet", file.name)
+        if match:
+            files[int(match.group(1))] = file
+
+    return dict(sorted(files.items()))
+
+
+def build_shard_store(
+    X_dir=COPPER_INTERIM_DIR / "X_train_bal",
+    y_dir=COPPER_INTERIM_DIR / "y_train_bal",
+    path=SHARDS_PATH,
+    rename=LEGACY_FEATURE_NAMES,
+):
+    """Consolidates the ``X_<i>.parquet`` / ``y_<i>.parquet`` shard pairs into one store.
+
+    ``rename`` maps old column names onto the current ones, so shards written before a feature
+    rename still line up. Every shard must end up with the same columns in the same order.
+    """
+
+    X_files = _shard_files(X_dir, "X")
+    y_files = _shard_files(y_dir, "y")
+
+    if X_files.keys() != y_files.keys():
+        raise ValueError(f"{X_dir} and {y_dir} do not hold the same shard ids")
+
+    feature_names = None
+    X_parts, y_parts, index_parts, offsets = [], [], [], [0]
+
+    for shard_id, X_file in X_files.items():
+
+        X_df = pd.read_parquet(X_file).rename(columns=rename)
+        y_df = pd.read_parquet(y_files[shard_id])
+
+        if feature_names is None:
+            feature_names = list(X_df.columns)
+        elif list(X_df.columns) != feature_names:
+            raise ValueError(f"Shard {shard_id} columns do not match shard {next(iter(X_files))}")
+
+        X_parts.append(X_df.to_numpy(dtype=np.float64))
+        y_parts.append(y_df.iloc[:, 0].to_numpy())
+        index_parts.append(X_df.index.to_numpy())
+        offsets.append(offsets[-1] + len(X_df))
+
+    X = np.concatenate(X_parts)
+    n_features = X.shape[1]
+
+    table = pa.table(
+        {
+            "shard_id": np.repeat(list(X_files), np.diff(offsets)).astype(np.int32),
+            "row_index": np.concatenate(index_parts).astype(np.int64),
+            "X": pa.FixedSizeListArray.from_arrays(pa.array(X.ravel()), n_features),
+            "y": np.concatenate(y_parts).astype(np.uint8),
+        }
+    )
+
+    path = Path(path)
+
+    # A single uncompressed record batch keeps every column contiguous in the file
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=table.num_rows)
+
+    manifest = {
+        "feature_names": feature_names,
+        "target_name": y_df.columns[0],
+        "shard_ids": list(X_files),
+        "offsets": offsets,
+    }
+    manifest_path(path).write_text(json.dumps(manifest, indent=1))
+
+    return path
+
+
+class ShardStore:
+    """Memory-mapped view of a store written by ``build_shard_store``.
+
+    ``X`` is the ``(n_rows, n_features)`` matrix of every shard and ``y`` the boolean target, both
+    zero-copy views of the mapped file, so opening the store costs milliseconds and the pages are
+    shared between processes that map the same file.
+    """
+
+    def __init__(self, path=SHARDS_PATH):
+
+        self.path = Path(path)
+
+        manifest = json.loads(manifest_path(self.path).read_text())
+        self.feature_names = manifest["feature_names"]
+        self.target_name = manifest["target_name"]
+        self.shard_ids = np.array(manifest["shard_ids"])
+        self.offsets = np.array(manifest["offsets"])
+
+        self._positions = {shard_id: i for i, shard_id in enumerate(manifest["shard_ids"])}
+
+        self._source = pa.memory_map(str(self.path), "r")
+        batch = pa.ipc.open_file(self._source).get_batch(0)
+
+        X_column = batch.column("X")
+        self.X = (
+            X_column.flatten().to_numpy(zero_copy_only=True).reshape(-1, X_column.type.list_size)
+        )
+        self.y = batch.column("y").to_numpy(zero_copy_only=True).view(bool)
+        self.row_index = batch.column("row_index").to_numpy(zero_copy_only=True)
+
+    def __len__(self):
+
+        return len(self.shard_ids)
+
+    def shard(self, shard_id):
+        """``(X, y)`` views of one shard"""
+
+        position = self._positions[shard_id]
+        start, stop = self.offsets[position], self.offsets[position + 1]
+
+        return self.X[start:stop], self.y[start:stop]
+
+    def shards(self, shard_ids=None):
+        """Lists of ``X`` and ``y`` views for ``shard_ids`` (all shards by default)"""
+
+        if shard_ids is None:
+            shard_ids = self.shard_ids
+
+        pairs = [self.shard(shard_id) for shard_id in shard_ids]
+
+        return [X for X, _ in pairs], [y for _, y in pairs]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Build the interim datasets")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    shards = commands.add_parser("shards", help="consolidate the balanced bootstrap shards")
+    shards.add_argument("--X-dir", type=Path, default=COPPER_INTERIM_DIR / "X_train_bal")
+    shards.add_argument("--y-dir", type=Path, default=COPPER_INTERIM_DIR / "y_train_bal")
+    shards.add_argument("--output", type=Path, default=SHARDS_PATH)
+
+    ingest = commands.add_parser("ingest", help="cache the raw workbook as Parquet")
+    ingest.add_argument("--raw", type=Path, default=COPPER_RAW_PATH)
+    ingest.add_argument("--cache-dir", type=Path, default=RAW_CACHE_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        df = load_raw_copper(args.raw, args.cache_dir)
+        print(f"Loaded {len(df)} rows x {df.shape[1]} columns of {args.raw}")
+
+    if args.command == "shards":
+        path = build_shard_store(args.X_dir, args.y_dir, args.output)
+        store = ShardStore(path)
+        print(f"Wrote {len(store)} shards ({store.X.shape[0]} rows) to {path}")
+
+
+if __name__ == "__main__":
+    main()
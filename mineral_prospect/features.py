@@ -0,0 +1,80 @@
+"""Derived ore features, shared by retraining and scoring"""
+
+import numpy as np
+import pandas as pd
+
+from mineral_prospect.config import (
+    CATEGORY_GROUPS,
+    DERIVED_FEATURES,
+    LOG_INF_REPL,
+    TO_LOG10,
+)
+
+# Columns the derived features are computed from (COPPER_GRADE as a fraction, not in %)
+BASE_FEATURES = ["GOLD_DENSITY", "SILVER_DENSITY", "COPPER_GRADE", "INITIAL_COST", "ORE_TONNAGE"]
+
+LOG10_FEATURES = [f"LOG_10_{col}" for col in TO_LOG10]
+
+# Columns of ``numeric_features``: every TO_LOG10 column, then their logarithms
+NUMERIC_FEATURES = TO_LOG10 + LOG10_FEATURES
+
+
+def numeric_features(base, out=None):
+    """Computes ``NUMERIC_FEATURES`` from an ``(n, 5)`` array of ``BASE_FEATURES``.
+
+    ``base`` can also be a DataFrame with the ``BASE_FEATURES`` columns. Every column is written
+    in place into ``out`` (a new ``(n, 24)`` float64 array by default), which is returned.
+    """
+
+    if isinstance(base, pd.DataFrame):
+        base = base[BASE_FEATURES].to_numpy(dtype=np.float64)
+
+    if out is None:
+        out = np.empty((len(base), len(NUMERIC_FEATURES)))
+
+    col = {name: out[:, i] for i, name in enumerate(NUMERIC_FEATURES)}
+
+    for i, name in enumerate(BASE_FEATURES):
+        col[name][:] = base[:, i]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+
+        # Total density of gold and silver (g/tonne)
+        np.add(col["GOLD_DENSITY"], col["SILVER_DENSITY"], out=col["PRECIOUS_ORE_DENSITY"])
+
+        # Estimated amounts of gold, silver and both (g) and of copper (tonnes) in the reservoir
+        np.multiply(col["ORE_TONNAGE"], col["GOLD_DENSITY"], out=col["GOLD_GRAMS"])
+        np.multiply(col["ORE_TONNAGE"], col["SILVER_DENSITY"], out=col["SILVER_GRAMS"])
+        np.multiply(col["ORE_TONNAGE"], col["PRECIOUS_ORE_DENSITY"], out=col["PRECIOUS_GRAMS"])
+        np.multiply(col["ORE_TONNAGE"], col["COPPER_GRADE"], out=col["COPPER_TONNAGE"])
+
+        # Non-physical indicator of the copper, gold and silver (usually found together)
+        np.add(col["COPPER_TONNAGE"], col["PRECIOUS_GRAMS"], out=col["ECONOMIC_AMOUNT"])
+
+        # Initial cost per amount of profitable metals
+        np.divide(col["INITIAL_COST"], col["ECONOMIC_AMOUNT"], out=col["INITIAL_COST_PER_AMOUNT"])
+
+        # Scale informative features, log10(0) = -inf is replaced by LOG_INF_REPL
+        n_log = len(TO_LOG10)
+        logs = out[:, n_log:]
+        np.log10(out[:, :n_log], out=logs)
+        logs[logs == -np.inf] = LOG_INF_REPL
+
+    return out
+
+
+def group_categories(df):
+    """Categorical columns of ``df`` with the ``CATEGORY_GROUPS`` merged"""
+
+    return pd.DataFrame(
+        {col: df[col].replace(groups) for col, groups in CATEGORY_GROUPS.items()}, index=df.index
+    )
+
+
+def add_features(df):
+    """``df`` with the categories grouped and the derived and ``LOG_10_`` columns appended"""
+
+    numeric = pd.DataFrame(numeric_features(df), columns=NUMERIC_FEATURES, index=df.index)
+    new_columns = DERIVED_FEATURES + LOG10_FEATURES
+
+    return pd.concat([df.assign(**group_categories(df)), numeric[new_columns]], axis=1)
@@ -0,0 +1,237 @@
+"""Versioned, memory-mappable model artifacts
+
+An artifact is a directory ``<models_dir>/<name>/v<version>/`` with
+
+- ``manifest.json``: format, classes, input columns, library versions and the study metadata
+  (study, trial, parameters, objective values), and the compiled tree layout if any,
+- ``pipeline.joblib``: the fitted pipeline without its samplers (which only apply when fitting),
+  uncompressed, so its NumPy arrays (e.g. the training rows of the KNN imputer and the node arrays
+  of the trees) are stored as raw buffers,
+- with ``compiled=True`` only, one ``.npy`` file per array of the compiled trees
+  (``compiled.CompiledTrees``).
+
+``load_artifact`` memory-maps the arrays, so worker processes that load the same artifact share
+its pages through the OS cache. It returns the fitted pipeline, whose ``predict_proba`` is the
+fastest for batch scoring; the compiled trees only pay off for small online batches of random
+forests (see ``compiled``) and are loaded with ``compiled=True``.
+"""
+
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+import joblib
+import numpy as np
+from imblearn.pipeline import Pipeline as ImbPipeline
+
+from mineral_prospect.config import MODELS_DIR
+from mineral_prospect.modeling.compiled import (
+    CompiledPipeline,
+    CompiledTrees,
+    compile_model,
+)
+
+FORMAT = "mineral_prospect.tree_artifact"
+FORMAT_VERSION = 2
+
+MANIFEST = "manifest.json"
+PIPELINE = "pipeline.joblib"
+TREE_ARRAYS = ("feature", "threshold", "missing_left", "value")
+
+LIBRARIES = ("numpy", "scikit-learn", "xgboost", "category_encoders", "mineral_prospect")
+
+
+def versions(name, models_dir=MODELS_DIR):
+    """Sorted versions of the artifacts of model ``name``"""
+
+    model_dir = Path(models_dir) / name
+
+    if not model_dir.is_dir():
+        return []
+
+    return sorted(
+        int(path.name[1:])
+        for path in model_dir.glob("v*")
+        if path.name[1:].isdigit() and (path / MANIFEST).exists()
+    )
+
+
+def artifact_path(name, version=None, models_dir=MODELS_DIR):
+    """Directory of version ``version`` (the latest by default) of model ``name``"""
+
+    if version is None:
+        existing = versions(name, models_dir)
+        if not existing:
+            raise FileNotFoundError(f"No artifact of {name!r} in {models_dir}")
+        version = existing[-1]
+
+    return Path(models_dir) / name / f"v{version}"
+
+
+def export_artifact(model, name, metadata=None, models_dir=MODELS_DIR, compiled=False):
+    """Writes the fitted pipeline ``model`` as the next version of artifact ``name``.
+
+    ``metadata`` (JSON serializable, e.g. the study and trial) is stored in the manifest. The
+    compiled trees of the classifier are stored too if ``compiled``. Returns the artifact
+    directory.
+    """
+
+    pipe = ImbPipeline([step for step in model.steps if not hasattr(step[1], "fit_resample")])
+
+    model_dir = Path(models_dir) / name
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    # Written under a temporary name so readers never see a partial artifact
+    tmp_dir = model_dir / f".tmp.{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+
+    joblib.dump(pipe, tmp_dir / PIPELINE)
+
+    manifest = {
+        "format": FORMAT,
+        "format_version": FORMAT_VERSION,
+        "name": name,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "classifier": type(pipe.steps[-1][1]).__name__,
+        "classes": pipe.classes_.tolist(),
+        "feature_names": [str(col) for col in getattr(pipe, "feature_names_in_", [])],
+        "pipeline": PIPELINE,
+        "libraries": library_versions(),
+        "metadata": metadata or {},
+    }
+
+    if compiled:
+        manifest["trees"] = _save_trees(compile_model(pipe.steps[-1][1]), tmp_dir)
+
+    # Versions are only claimed by the rename, so concurrent exports cannot overwrite each other
+    while True:
+        manifest["version"] = (versions(name, models_dir) or [0])[-1] + 1
+        (tmp_dir / MANIFEST).write_text(json.dumps(manifest, indent=2))
+        path = model_dir / f"v{manifest['version']}"
+        try:
+            tmp_dir.rename(path)
+            return path
+        except OSError:
+            if not path.exists():
+                raise
+
+
+def _save_trees(trees, directory):
+
+    arrays = {}
+
+    for key in TREE_ARRAYS:
+        array = getattr(trees, key)
+        np.save(directory / f"{key}.npy", array)
+        arrays[key] = {"file": f"{key}.npy", "dtype": array.dtype.str, "shape": array.shape}
+
+    return {
+        "kind": trees.kind,
+        "depth": trees.depth,
+        "n_trees": trees.n_trees,
+        "base_margin": float(trees.base_margin),
+        "arrays": arrays,
+    }
+
+
+def load_artifact(path, mmap=True, compiled=False):
+    """Fitted pipeline of an artifact directory, with memory-mapped arrays if ``mmap``.
+
+    With ``compiled``, a ``CompiledPipeline`` of its compiled trees instead, for small online
+    batches; the artifact must have been exported with ``compiled=True``.
+    """
+
+    path = Path(path)
+    manifest = read_manifest(path)
+    mmap_mode = "r" if mmap else None
+
+    pipe = joblib.load(path / manifest["pipeline"], mmap_mode=mmap_mode)
+
+    if not compiled:
+        return pipe
+
+    if "trees" not in manifest:
+        raise ValueError(f"{path} was exported without compiled trees")
+
+    tree_info = manifest["trees"]
+    arrays = {
+        # Plain ndarray views of the mapping, so indexing does not go through np.memmap
+        key: np.asarray(np.load(path / info["file"], mmap_mode=mmap_mode))
+        for key, info in tree_info["arrays"].items()
+    }
+
+    trees = CompiledTrees(
+        kind=tree_info["kind"],
+        depth=tree_info["depth"],
+        base_margin=tree_info["base_margin"],
+        **arrays,
+    )
+
+    return CompiledPipeline(
+        steps=[step for _, step in pipe.steps[:-1]],
+        trees=trees,
+        classes=manifest["classes"],
+        feature_names=manifest["feature_names"] or None,
+    )
+
+
+def read_manifest(path):
+    """Manifest of an artifact directory, checked against the supported format"""
+
+    manifest = json.loads((Path(path) / MANIFEST).read_text())
+
+    if manifest.get("format") != FORMAT or manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"{path} is not a {FORMAT} v{FORMAT_VERSION} artifact "
+            f"({manifest.get('format')} v{manifest.get('format_version')})"
+        )
+
+    return manifest
+
+
+def library_versions():
+    """Installed versions of ``LIBRARIES``"""
+
+    found = {}
+
+    for library in LIBRARIES:
+        try:
+            found[library] = version(library)
+        except PackageNotFoundError:
+            pass
+
+    return found
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Exports a pipeline saved by train.save_model as a versioned artifact"
+    )
+    parser.add_argument("model", type=Path, help="pipeline saved by train.save_model")
+    parser.add_argument("name", help="artifact name, models/<name>/v<version>")
+    parser.add_argument("--models-dir", type=Path, default=MODELS_DIR)
+    parser.add_argument(
+        "--compiled", action="store_true", help="also store the compiled trees (online scoring)"
+    )
+
+    args = parser.parse_args()
+
+    path = export_artifact(
+        joblib.load(args.model),
+        args.name,
+        metadata={"source": str(args.model)},
+        models_dir=args.models_dir,
+        compiled=args.compiled,
+    )
+
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
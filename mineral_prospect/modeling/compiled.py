@@ -0,0 +1,361 @@
+"""Fitted tree models flattened into node arrays and evaluated level by level
+
+Every tree of a ``DecisionTreeClassifier``, ``RandomForestClassifier`` or ``XGBClassifier`` is
+padded to a complete binary tree of the ensemble's depth (a leaf above the last level is repeated
+in both its subtrees) and stored in contiguous arrays: split feature, threshold and default
+direction of missing values for the internal nodes, value for the last level. The children of
+node ``i`` are ``2i + 1`` and ``2i + 2``, so a batch is evaluated for all trees at once, one level
+per step, with no child pointers and no per-estimator dispatch. The comparisons, dtypes and
+summation order are those of ``predict_proba``, so the probabilities are identical.
+
+This only pays off for small online batches of random forests, where ``predict_proba`` spends
+most of its time dispatching the estimators. Measured on one core with the ``tree_models``
+preprocessor (classifier step alone, end to end in brackets):
+
+- random forest, 300 trees of depth 7: 32x (2.8x) faster for one row, 4.5x (1.7x) for 100 rows,
+  1.4x for 1,000 rows, and 0.7x (0.8x) for 100,000 rows,
+- decision tree: 0.7-1.1x at every size,
+- XGBoost, 300 trees: 1.0-1.3x up to 10 rows, then down to 0.4x for 100,000 rows.
+
+Batch scoring (``predict.ProspectScorer``, ``artifact.load_artifact``) therefore uses the fitted
+pipeline, and the compiled trees are only used when asked for.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Complete trees have 2 ** depth leaves, the searched models stay at depth 7 or less
+MAX_DEPTH = 12
+
+# XGBoost computes the sigmoid with the C library's float32 ``expf``, which NumPy's float32
+# ``exp`` does not reproduce. Rounding the float64 ``exp`` gives the same result except close to
+# halfway between two floats, where ``expf`` itself is called
+_LIBM = ctypes.CDLL(ctypes.util.find_library("m") or "libm.so.6")
+_LIBM.expf.restype = ctypes.c_float
+_LIBM.expf.argtypes = [ctypes.c_float]
+_LIBM.logf.restype = ctypes.c_float
+_LIBM.logf.argtypes = [ctypes.c_float]
+
+
+def _expf(x):
+
+    exact = np.exp(x.astype(np.float64))
+    rounded = exact.astype(np.float32)
+
+    halfway = np.abs(exact - rounded) > 0.49 * np.spacing(rounded).astype(np.float64)
+    rounded[halfway] = [_LIBM.expf(value) for value in x[halfway].tolist()]
+
+    return rounded
+
+
+class CompiledTrees:
+    """Class probabilities of a compiled tree model, see ``compile_model``"""
+
+    def __init__(self, kind, feature, threshold, missing_left, value, depth, base_margin=0.0):
+
+        self.kind = kind
+        self.feature = feature
+        self.threshold = threshold
+        self.missing_left = missing_left
+        self.value = value
+        self.depth = depth
+        self.base_margin = np.float32(base_margin)
+
+    @property
+    def n_trees(self):
+
+        return len(self.value) >> self.depth
+
+    def leaves(self, X):
+        """``(n_trees, n_samples)`` index in ``value`` of the leaf each tree sends each sample to"""
+
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_internal = (1 << self.depth) - 1
+
+        flat = X.ravel()
+        cells = (np.arange(len(X)) * X.shape[1])[None, :]
+        offsets = (np.arange(self.n_trees) * n_internal)[:, None]
+        has_nan = bool(np.isnan(flat).any())
+
+        position = np.zeros((self.n_trees, len(X)), dtype=np.intp)
+
+        for _ in range(self.depth):
+
+            node = offsets + position
+            x = flat[cells + self.feature[node]]
+
+            # scikit-learn sends x <= threshold to the left, XGBoost x < threshold
+            if self.kind == "xgboost":
+                go_right = ~(x < self.threshold[node])
+            else:
+                go_right = ~(x <= self.threshold[node])
+
+            if has_nan:
+                go_right &= ~(np.isnan(x) & self.missing_left[node])
+
+            position *= 2
+            position += 1
+            position += go_right
+
+        position -= n_internal
+        position += (np.arange(self.n_trees) << self.depth)[:, None]
+
+        return position
+
+    def predict_proba(self, X, chunk_size=1 << 16):
+        """``(n_samples, n_classes)`` probabilities, in chunks of ``chunk_size`` tree evaluations
+
+        The default keeps the per-level arrays of a chunk in the CPU cache.
+        """
+
+        # Both libraries compare float32 features
+        X = np.asarray(X, dtype=np.float32)
+
+        rows = max(1, chunk_size // self.n_trees)
+
+        starts = range(0, max(len(X), 1), rows)
+        stops = [*starts[1:], len(X)]
+
+        return np.concatenate([self._proba(X[start:stop]) for start, stop in zip(starts, stops)])
+
+    def _proba(self, X):
+
+        leaf_values = self.value[self.leaves(X)]
+
+        if self.kind == "xgboost":
+            # Leaf values are added to the base margin tree by tree in float32
+            margin = np.full(len(X), self.base_margin, dtype=np.float32)
+            for tree_values in leaf_values:
+                margin += tree_values
+            positive = np.float32(1) / (np.float32(1) + _expf(-margin))
+            return np.column_stack([np.float32(1) - positive, positive])
+
+        # Tree by tree, like the forest does (a reduction could sum pairwise)
+        proba = np.zeros(leaf_values.shape[1:])
+        for tree_values in leaf_values:
+            proba += tree_values
+
+        return proba / self.n_trees
+
+
+def _complete(tree, depth):
+
+    # Node of the original tree at each position of the complete tree, level by level
+    nodes = np.zeros(1, dtype=np.intp)
+    internal = []
+
+    for _ in range(depth):
+        internal.append(nodes)
+        is_leaf = tree["left"][nodes] < 0
+        left = np.where(is_leaf, nodes, tree["left"][nodes])
+        right = np.where(is_leaf, nodes, tree["right"][nodes])
+        nodes = np.column_stack([left, right]).ravel()
+
+    internal = np.concatenate(internal) if internal else nodes[:0]
+
+    return {
+        # A repeated leaf compares on feature 0 and leads to itself either way
+        "feature": np.where(tree["left"][internal] < 0, 0, tree["feature"][internal]),
+        "threshold": tree["threshold"][internal],
+        "missing_left": tree["missing_left"][internal],
+        "value": tree["value"][nodes],
+    }
+
+
+def _concatenate(trees, kind, base_margin=0.0):
+
+    depth = max(tree["depth"] for tree in trees)
+
+    if depth > MAX_DEPTH:
+        raise ValueError(f"Trees deeper than {MAX_DEPTH} levels are not compiled (got {depth})")
+
+    complete = [_complete(tree, depth) for tree in trees]
+    dtype = np.float32 if kind == "xgboost" else np.float64
+
+    return CompiledTrees(
+        kind=kind,
+        feature=np.concatenate([tree["feature"] for tree in complete]).astype(np.intp),
+        threshold=np.concatenate([tree["threshold"] for tree in complete]).astype(dtype),
+        missing_left=np.concatenate([tree["missing_left"] for tree in complete]).astype(bool),
+        value=np.concatenate([tree["value"] for tree in complete]).astype(dtype),
+        depth=depth,
+        base_margin=base_margin,
+    )
+
+
+def _sklearn_tree(estimator):
+
+    tree = estimator.tree_
+
+    return {
+        "feature": tree.feature,
+        "threshold": tree.threshold,
+        "left": tree.children_left,
+        "right": tree.children_right,
+        "missing_left": tree.missing_go_to_left.astype(bool),
+        "value": tree.value[:, 0, :],
+        "depth": tree.max_depth,
+    }
+
+
+def _xgboost_trees(model):
+
+    learner = json.loads(model.get_booster().save_raw("json"))["learner"]
+
+    if learner["objective"]["name"] != "binary:logistic":
+        raise ValueError("Only binary:logistic XGBoost models can be compiled")
+
+    trees = []
+
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+
+        left = np.asarray(tree["left_children"])
+        split_conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+
+        parents = np.asarray(tree["parents"])
+        depth = np.zeros(len(left), dtype=int)
+        for node in range(1, len(left)):
+            depth[node] = depth[parents[node]] + 1
+
+        trees.append(
+            {
+                "feature": np.asarray(tree["split_indices"]),
+                "threshold": split_conditions,
+                "left": left,
+                "right": np.asarray(tree["right_children"]),
+                "missing_left": np.asarray(tree["default_left"], dtype=bool),
+                # The split condition of a leaf is its (learning rate scaled) value
+                "value": split_conditions,
+                "depth": int(depth.max()),
+            }
+        )
+
+    base_score = float(learner["learner_model_param"]["base_score"].strip("[]"))
+
+    return trees, base_score
+
+
+def compile_model(model):
+    """Compiles a fitted decision tree, random forest or XGBoost binary classifier"""
+
+    if hasattr(model, "get_booster"):
+        trees, base_score = _xgboost_trees(model)
+        # Logit of the base score, as XGBoost computes it
+        odds = np.float32(1) / np.float32(base_score) - np.float32(1)
+        return _concatenate(trees, "xgboost", base_margin=-_LIBM.logf(odds))
+
+    if hasattr(model, "estimators_"):
+        return _concatenate(
+            [_sklearn_tree(estimator) for estimator in model.estimators_], "forest"
+        )
+
+    if hasattr(model, "tree_"):
+        return _concatenate([_sklearn_tree(model)], "tree")
+
+    raise TypeError(f"Cannot compile {type(model).__name__}")
+
+
+class CompiledPipeline:
+    """Preprocessing steps followed by compiled trees, see ``from_pipeline``.
+
+    Exposes the ``predict_proba``, ``classes_`` and ``feature_names_in_`` used for scoring.
+    """
+
+    def __init__(self, steps, trees, classes, feature_names=None):
+
+        self.steps = steps
+        self.trees = trees
+        self.classes_ = np.asarray(classes)
+
+        if feature_names is not None:
+            self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+
+    @classmethod
+    def from_pipeline(cls, pipe):
+        """Replaces the classifier step of a fitted pipeline with its compiled trees.
+
+        The other steps (except samplers, which only apply when fitting) still transform the
+        input.
+        """
+
+        return cls(
+            steps=[step for _, step in pipe.steps[:-1] if not hasattr(step, "fit_resample")],
+            trees=compile_model(pipe.steps[-1][1]),
+            classes=pipe.classes_,
+            feature_names=getattr(pipe, "feature_names_in_", None),
+        )
+
+    def predict_proba(self, X):
+
+        for step in self.steps:
+            X = step.transform(X)
+
+        return self.trees.predict_proba(X)
+
+
+def benchmark(pipe, X, repeats=5, batch_sizes=(1, 10, 100, 1000)):
+    """Best-of-``repeats`` seconds of ``predict_proba`` for ``pipe`` and its compiled version.
+
+    One row per batch size, the first rows of ``X``.
+    """
+
+    compiled = CompiledPipeline.from_pipeline(pipe)
+
+    results = []
+
+    for batch_size in batch_sizes:
+
+        batch = X[:batch_size]
+        timings = {}
+        outputs = {}
+
+        for name, model in (("predict_proba", pipe), ("compiled", compiled)):
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                outputs[name] = model.predict_proba(batch)
+                times.append(time.perf_counter() - start)
+            timings[name] = min(times)
+
+        results.append(
+            {
+                "rows": len(batch),
+                "predict_proba_s": timings["predict_proba"],
+                "compiled_s": timings["compiled"],
+                "speedup": timings["predict_proba"] / timings["compiled"],
+                "identical": bool(np.array_equal(outputs["predict_proba"], outputs["compiled"])),
+            }
+        )
+
+    return pd.DataFrame(results)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Compares a saved pipeline with its compiled trees"
+    )
+    parser.add_argument("model", help="pipeline saved by train.save_model")
+    parser.add_argument("data", help="Parquet file with the pipeline's input columns")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000], help="rows per call"
+    )
+
+    args = parser.parse_args()
+
+    pipe = joblib.load(args.model)
+    X = pd.read_parquet(args.data, columns=list(pipe.feature_names_in_))
+
+    print(benchmark(pipe, X, args.repeats, args.batch_sizes).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
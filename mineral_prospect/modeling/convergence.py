@@ -0,0 +1,195 @@
+"""Stopping two-objective studies once their Pareto front has stopped moving
+
+``HypervolumeStop`` is a study callback. After every trial it adds the trials finished since its
+last call to a running Pareto front of the two objectives and updates the front's hypervolume
+(the area it dominates up to ``reference_point``). Once the hypervolume gained less than
+``min_improvement`` (relative) over the last ``patience`` trials, it stops the study and stores
+why as the ``stop_reason`` study user attribute. The callback reads the study storage, so every
+worker process reaches the same decision.
+
+Trials are counted like ``runner.optimize_in_processes`` counts them: the ones added by
+``staged.add_size_trials`` move the front but do not count towards ``patience``::
+
+    python -m mineral_prospect.modeling.convergence journal:///random_forest.log random_forest
+"""
+
+import argparse
+import bisect
+import math
+
+import optuna
+import pandas as pd
+from optuna.study import StudyDirection
+from optuna.trial import TrialState
+
+from mineral_prospect.modeling.staged import GROWN_FROM_ATTR
+from mineral_prospect.modeling.storage import get_storage
+
+STOP_REASON_ATTR = "stop_reason"
+
+# (mean ROC-AUC, log10 std): a random classifier, and a standard deviation of 1
+REFERENCE_POINT = (0.5, 0.0)
+
+
+class ParetoFront2D:
+    """Pareto front of two minimized objectives with its hypervolume up to ``reference_point``"""
+
+    def __init__(self, reference_point):
+
+        self.reference_point = tuple(reference_point)
+        self.points = []
+        self.hypervolume = 0.0
+
+    def add(self, point):
+        """Adds ``point``; returns whether it changed the front"""
+
+        x, y = point
+        ref_x, ref_y = self.reference_point
+
+        if not (x < ref_x and y < ref_y):
+            return False
+
+        # Sorted by the first objective, so the second one decreases along the front
+        position = bisect.bisect_right(self.points, (x, y))
+
+        if position > 0 and self.points[position - 1][1] <= y:
+            return False
+
+        stop = position
+        while stop < len(self.points) and self.points[stop][1] >= y:
+            stop += 1
+
+        self.points[position:stop] = [(x, y)]
+        self.hypervolume = self._area()
+
+        return True
+
+    def _area(self):
+
+        ref_x, ref_y = self.reference_point
+        edges = [x for x, _ in self.points[1:]] + [ref_x]
+
+        return sum((edge - x) * (ref_y - y) for (x, y), edge in zip(self.points, edges))
+
+
+def _minimized(values, directions):
+
+    return tuple(-v if d == StudyDirection.MAXIMIZE else v for v, d in zip(values, directions))
+
+
+class HypervolumeStop:
+    """Study callback that stops once the Pareto front's hypervolume stops growing.
+
+    ``reference_point`` is in the objectives' own terms (the default suits the
+    ``(mean ROC-AUC, log10 std)`` studies). No study stops before ``n_min_trials`` trials.
+    """
+
+    def __init__(
+        self,
+        patience=500,
+        min_improvement=1e-3,
+        n_min_trials=1000,
+        reference_point=REFERENCE_POINT,
+    ):
+
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.n_min_trials = n_min_trials
+        self.reference_point = reference_point
+
+        self._front = None
+        self._seen = set()
+        self._history = []
+
+    def __call__(self, study, trial):
+
+        if len(study.directions) != 2:
+            raise ValueError("HypervolumeStop needs a study with two objectives")
+
+        if self._front is None:
+            self._front = ParetoFront2D(_minimized(self.reference_point, study.directions))
+
+        self._update(study)
+
+        n_trials = len(self._history)
+
+        if n_trials < max(self.n_min_trials, self.patience + 1):
+            return
+
+        before, now = self._history[-self.patience - 1], self._history[-1]
+        improvement = (now - before) / now if now > 0 else 0.0
+
+        if improvement < self.min_improvement:
+            study.set_user_attr(
+                STOP_REASON_ATTR,
+                {
+                    "reason": "hypervolume",
+                    "trial": trial.number,
+                    "n_trials": n_trials,
+                    "hypervolume": now,
+                    "improvement": improvement,
+                    "patience": self.patience,
+                    "min_improvement": self.min_improvement,
+                },
+            )
+            study.stop()
+
+    def _update(self, study):
+
+        finished = study.get_trials(
+            deepcopy=False, states=(TrialState.COMPLETE, TrialState.PRUNED)
+        )
+
+        for trial in finished:
+
+            if trial.number in self._seen:
+                continue
+
+            self._seen.add(trial.number)
+
+            if trial.state == TrialState.COMPLETE and all(map(math.isfinite, trial.values)):
+                self._front.add(_minimized(trial.values, study.directions))
+
+            # One entry per sampled trial, in the order this process saw them finish
+            if GROWN_FROM_ATTR not in trial.user_attrs:
+                self._history.append(self._front.hypervolume)
+
+
+def hypervolume_curve(study, reference_point=REFERENCE_POINT):
+    """Hypervolume of the Pareto front of the complete trials up to each trial number"""
+
+    front = ParetoFront2D(_minimized(reference_point, study.directions))
+    curve = {}
+
+    for trial in study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,)):
+        if all(map(math.isfinite, trial.values)):
+            front.add(_minimized(trial.values, study.directions))
+        curve[trial.number] = front.hypervolume
+
+    return pd.Series(curve, name="hypervolume").rename_axis("trial")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Hypervolume convergence of a study")
+    parser.add_argument("storage", help="e.g. journal:///random_forest.log")
+    parser.add_argument("study", help="study name")
+    parser.add_argument("--points", type=int, default=20, help="rows of the curve to print")
+
+    args = parser.parse_args()
+
+    study = optuna.load_study(study_name=args.study, storage=get_storage(args.storage))
+
+    print(f"Stop reason: {study.user_attrs.get(STOP_REASON_ATTR, 'none recorded')}")
+
+    curve = hypervolume_curve(study)
+
+    if curve.empty:
+        return
+
+    step = max(1, len(curve) // args.points)
+    print(curve.iloc[::step].round(6).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Cross-validation over pre-transformed folds"""
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import roc_auc_score
+
+from mineral_prospect.modeling.profiling import stage
+from mineral_prospect.modeling.resources import limit_n_jobs
+
+
+def fit_roc_auc(estimator, fold, predictions=None):
+    """Fits a clone of ``estimator`` on one fold and returns its validation ROC-AUC.
+
+    The validation probabilities are appended to the list ``predictions`` if one is given.
+    """
+
+    X_train, y_train, X_valid, y_valid = fold
+
+    with stage("fit"):
+        model = limit_n_jobs(clone(estimator)).fit(X_train, y_train)
+
+    with stage("predict"):
+        proba = model.predict_proba(X_valid)[:, 1]
+
+    if predictions is not None:
+        predictions.append(proba)
+
+    with stage("score"):
+        return roc_auc_score(y_valid, proba)
+
+
+def cross_val_roc_auc(estimator, folds, trial=None, pruner=None, predictions=None):
+    """Equivalent of ``cross_val_score(..., scoring="roc_auc")`` over cached ``folds``.
+
+    With a ``trial`` and a ``pruning.FoldPruner`` the running mean is reported after each fold
+    and the trial is pruned as soon as the pruner decides it is hopeless. The validation
+    probabilities of each fold are appended to ``predictions`` if given (see ``oof.OOFStore``).
+    """
+
+    scores = []
+
+    for fold in folds:
+
+        scores.append(fit_roc_auc(estimator, fold, predictions))
+
+        if pruner is not None:
+            with stage("prune"):
+                pruner.report(trial, scores)
+
+    return np.array(scores)
@@ -0,0 +1,250 @@
+"""Multi-fidelity studies: successive halving / Hyperband over training budgets
+
+A ``Budget`` is a stratified subset of the training set scored with its own cross-validation
+splitter. ``MultiFidelity.climb`` scores a trial on the cheap budgets first, from the smallest
+up, and prunes it unless its mean ROC-AUC is among the best ``1 / reduction_factor`` of the
+trials of its bracket at each of them. Only the promoted trials reach the last budget (normally
+the full ``X_train`` with ``RKF``), which the objective scores as before. With ``n_brackets > 1``
+the trials are spread over Hyperband brackets that start at later budgets.
+
+The subsets are nested: every budget contains the rows of the smaller ones. The results at each
+budget are stored as the ``budget_auc`` user attribute and ``budget_report`` collects them::
+
+    python -m mineral_prospect.modeling.fidelity journal:///random_forest.log random_forest
+"""
+
+import argparse
+import copy
+import math
+
+import numpy as np
+import optuna
+import pandas as pd
+
+from mineral_prospect.modeling.fold_cache import FoldCache
+from mineral_prospect.modeling.pruning import FOLD_AUC_ATTR
+from mineral_prospect.modeling.storage import get_storage
+
+BUDGET_ATTR = "budget_auc"
+
+
+class Budget:
+    """The fraction ``rows`` of the training set (stratified) scored with the splitter ``cv``"""
+
+    def __init__(self, rows, cv):
+
+        if not 0 < rows <= 1:
+            raise ValueError(f"rows is a fraction of the training set, got {rows}")
+
+        self.rows = rows
+        self.cv = cv
+
+    def __repr__(self):
+
+        return f"Budget(rows={self.rows}, cv={self.cv!r})"
+
+
+def _subset(y, fraction, seed):
+
+    # One permutation per class, so the subsets of every fraction are nested
+    rng = np.random.default_rng(seed)
+    rows = []
+
+    for label in np.unique(y):
+        members = rng.permutation(np.flatnonzero(y == label))
+        rows.append(members[: round(fraction * len(members))])
+
+    return np.sort(np.concatenate(rows))
+
+
+def _take(X, rows):
+
+    return X.iloc[rows] if hasattr(X, "iloc") else X[rows]
+
+
+class MultiFidelity:
+    """Successive halving over ``budgets``, ordered from the cheapest to the full one"""
+
+    def __init__(self, budgets, reduction_factor=3, n_startup_trials=20, n_brackets=1, seed=0):
+
+        if not 1 <= n_brackets <= len(budgets):
+            raise ValueError(f"n_brackets must be between 1 and {len(budgets)}")
+
+        self.budgets = list(budgets)
+        self.reduction_factor = reduction_factor
+        self.n_startup_trials = n_startup_trials
+        self.n_brackets = n_brackets
+        self.seed = seed
+
+        self.folds = None
+        self.fold_cache = None
+
+    def prepare(self, preprocessor, X, y, resampler=None, cache_dir=None):
+        """Copy with the cached folds of every budget, resampled by ``resampler`` if given.
+
+        ``folds`` holds the folds of each budget and ``fold_cache`` the ``FoldCache`` of the
+        last one.
+        """
+
+        prepared = copy.copy(self)
+        prepared.folds = []
+
+        labels = np.asarray(y).ravel()
+
+        for budget in self.budgets:
+
+            if budget.rows < 1:
+                rows = _subset(labels, budget.rows, self.seed)
+                X_budget, y_budget = _take(X, rows), _take(y, rows)
+            else:
+                X_budget, y_budget = X, y
+
+            prepared.fold_cache = FoldCache(preprocessor, X_budget, y_budget, cache_dir=cache_dir)
+            folds = prepared.fold_cache.split(budget.cv)
+
+            if resampler is not None:
+                resampler.precompute(folds)
+
+            prepared.folds.append(folds)
+
+        return prepared
+
+    def climb(self, trial, score):
+        """Scores ``trial`` on the cheap budgets of its bracket and returns the last budget's folds.
+
+        ``score(folds)`` returns the fold ROC-AUCs of the trial's estimator. Raises
+        ``TrialPruned`` at the first budget where the trial is not promoted.
+        """
+
+        bracket = trial.number % self.n_brackets
+        last = len(self.budgets) - 1
+
+        record = {"bracket": bracket, "rungs": []}
+
+        for rung in range(bracket, last):
+
+            scores = np.asarray(score(self.folds[rung]))
+            value = float(np.mean(scores))
+
+            record["rungs"].append(
+                {**self._describe(rung), "mean": value, "scores": scores.tolist()}
+            )
+            trial.set_user_attr(BUDGET_ATTR, record)
+
+            if not self._promoted(trial, bracket, rung, value):
+                raise optuna.TrialPruned(
+                    f"Not promoted past budget {rung} with mean ROC-AUC {value:.4f}"
+                )
+
+        # Scored by the objective itself, see budget_report
+        record["rungs"].append(self._describe(last))
+        trial.set_user_attr(BUDGET_ATTR, record)
+
+        return self.folds[last]
+
+    def _describe(self, rung):
+
+        folds = self.folds[rung]
+
+        return {"rung": rung, "rows": len(folds[0][1]) + len(folds[0][3]), "folds": len(folds)}
+
+    def _promoted(self, trial, bracket, rung, value):
+
+        # Running trials count too (asynchronous successive halving)
+        others = [
+            entry["mean"]
+            for t in trial.study.get_trials(deepcopy=False)
+            if t.number != trial.number
+            and t.user_attrs.get(BUDGET_ATTR, {}).get("bracket") == bracket
+            for entry in t.user_attrs[BUDGET_ATTR]["rungs"]
+            if entry["rung"] == rung and "mean" in entry
+        ]
+
+        if len(others) < self.n_startup_trials:
+            return True
+
+        n_promoted = math.ceil((len(others) + 1) / self.reduction_factor)
+        threshold = np.sort(np.append(others, value))[::-1][n_promoted - 1]
+
+        return value >= threshold
+
+
+def budget_report(study):
+    """One row per trial and budget: its size, folds and mean ROC-AUC, and the trial's state.
+
+    The mean at the last budget is the trial's running mean after its last fold (``fold_auc``),
+    so it covers fewer folds than ``folds`` when the fold pruner stopped the trial.
+    """
+
+    rows = []
+
+    for trial in study.get_trials(deepcopy=False):
+
+        if BUDGET_ATTR not in trial.user_attrs:
+            continue
+
+        record = trial.user_attrs[BUDGET_ATTR]
+
+        for entry in record["rungs"]:
+
+            mean, folds_done = entry.get("mean"), entry["folds"]
+
+            if mean is None:
+                fold_auc = trial.user_attrs.get(FOLD_AUC_ATTR, [])
+                mean = fold_auc[-1] if fold_auc else np.nan
+                folds_done = len(fold_auc)
+
+            rows.append(
+                {
+                    "trial": trial.number,
+                    "state": trial.state.name,
+                    "bracket": record["bracket"],
+                    "rung": entry["rung"],
+                    "rows": entry["rows"],
+                    "folds": entry["folds"],
+                    "folds_done": folds_done,
+                    "mean": mean,
+                }
+            )
+
+    return pd.DataFrame(rows)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Results per budget of a multi-fidelity study")
+    parser.add_argument("storage", help="e.g. journal:///random_forest.log")
+    parser.add_argument("study", help="study name")
+
+    args = parser.parse_args()
+
+    study = optuna.load_study(study_name=args.study, storage=get_storage(args.storage))
+    report = budget_report(study)
+
+    if report.empty:
+        print(f"No multi-fidelity trials in {args.study}")
+        return
+
+    summary = report.groupby("rung").agg(
+        rows=("rows", "first"),
+        folds=("folds", "first"),
+        trials=("trial", "nunique"),
+        fits=("folds_done", "sum"),
+        mean_auc_median=("mean", "median"),
+        mean_auc_max=("mean", "max"),
+    )
+    summary["fit_share"] = summary["fits"] / summary["fits"].sum()
+
+    # How well each budget ranks the trials that also reached the next one
+    means = report.pivot_table(index="trial", columns="rung", values="mean")
+    summary["spearman_next"] = [
+        means[rung].corr(means[rung + 1], method="spearman") if rung + 1 in means else np.nan
+        for rung in summary.index
+    ]
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(summary.round(4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Fold-level cache of fitted preprocessors shared across optimization trials"""
+
+import os
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.base import clone
+
+from mineral_prospect.modeling.profiling import stage
+
+
+def config_key(estimator):
+    """Stable hash of an estimator configuration (classes, parameters and callables by name)"""
+
+    return joblib.hash(_describe(estimator))
+
+
+def _describe(obj):
+
+    if hasattr(obj, "get_params") and not isinstance(obj, type):
+        params = obj.get_params(deep=False)
+        return (_qualname(type(obj)), {key: _describe(params[key]) for key in sorted(params)})
+
+    if isinstance(obj, dict):
+        return {key: _describe(obj[key]) for key in sorted(obj)}
+
+    if isinstance(obj, (list, tuple)):
+        return [_describe(item) for item in obj]
+
+    if callable(obj):
+        return _qualname(obj)
+
+    return repr(obj)
+
+
+def _qualname(obj):
+
+    return f"{getattr(obj, '__module__', '')}.{getattr(obj, '__qualname__', repr(obj))}"
+
+
+class FoldCache:
+    """Fits ``preprocessor`` once per (train, validation) split and keeps the transformed arrays.
+
+    Entries are keyed on the preprocessor configuration, the training data and the fold indices,
+    so every trial of a study can start directly at the resampling/classifier steps. When
+    ``cache_dir`` is given the arrays are also stored as ``.npz`` files and reused by other
+    processes and later runs. ``key`` identifies the preprocessor and training data.
+    """
+
+    def __init__(self, preprocessor, X, y, cache_dir=None):
+
+        self.preprocessor = preprocessor
+        self.X = X
+        self.y = np.asarray(y).ravel()
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+
+        self.key = joblib.hash((config_key(preprocessor), X, self.y))
+        self._folds = {}
+
+    def fold(self, train_idx, valid_idx):
+        """Returns ``(X_train, y_train, X_valid, y_valid)`` with the preprocessor applied"""
+
+        key = joblib.hash((self.key, np.asarray(train_idx), np.asarray(valid_idx)))
+
+        if key not in self._folds:
+            self._folds[key] = self._load(key) or self._fit(key, train_idx, valid_idx)
+
+        return self._folds[key]
+
+    def split(self, cv):
+        """Returns the cached folds of the cross-validation splitter ``cv``"""
+
+        return [
+            self.fold(train_idx, valid_idx) for train_idx, valid_idx in cv.split(self.X, self.y)
+        ]
+
+    def _fit(self, key, train_idx, valid_idx):
+
+        preprocessor = clone(self.preprocessor)
+
+        with stage("preprocess"):
+            X_train = preprocessor.fit_transform(_take(self.X, train_idx), self.y[train_idx])
+            X_valid = preprocessor.transform(_take(self.X, valid_idx))
+
+        fold = (X_train, self.y[train_idx], X_valid, self.y[valid_idx])
+
+        if self.cache_dir is not None:
+            self._save(key, fold)
+
+        return fold
+
+    def _path(self, key):
+
+        return self.cache_dir / f"{key}.npz"
+
+    def _load(self, key):
+
+        if self.cache_dir is None or not self._path(key).exists():
+            return None
+
+        with np.load(self._path(key)) as data:
+            return (data["X_train"], data["y_train"], data["X_valid"], data["y_valid"])
+
+    def _save(self, key, fold):
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # Written under a temporary name so concurrent readers never see a partial file
+        tmp_path = self.cache_dir / f"{key}.{os.getpid()}.tmp.npz"
+        X_train, y_train, X_valid, y_valid = fold
+        np.savez(tmp_path, X_train=X_train, y_train=y_train, X_valid=X_valid, y_valid=y_valid)
+        os.replace(tmp_path, self._path(key))
+
+
+def _take(X, idx):
+
+    return X.iloc[idx] if hasattr(X, "iloc") else X[idx]
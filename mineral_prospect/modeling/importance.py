@@ -0,0 +1,278 @@
+"""Feature importance experiments over the balanced bootstrap shards"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from boruta import BorutaPy
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from tqdm import tqdm
+
+from mineral_prospect.modeling.resources import (
+    allocate,
+    estimator_threads,
+    limit_n_jobs,
+    limit_threads,
+    limited_threads,
+)
+
+############################## SHARED MEMORY ##############################
+
+
+def _share(array):
+    """Copies ``array`` into a new shared memory block; returns the block and its spec"""
+
+    array = np.ascontiguousarray(array)
+
+    # Object arrays hold pointers into this process, meaningless in another one
+    if array.dtype.hasobject:
+        raise ValueError("Object arrays cannot be shared, pass them to the workers instead")
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def _attach(spec):
+
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+
+    return block, np.ndarray(shape, dtype, buffer=block.buf)
+
+
+# Arrays attached by each worker process, filled by the pool initializer
+_WORKER = {}
+
+
+def _init_worker(specs, n_threads, objects=None):
+
+    limit_threads(n_threads)
+
+    for key, spec in specs.items():
+        _WORKER[key] = _attach(spec)
+
+    # Pickled once per worker, for data that cannot live in shared memory
+    for key, obj in (objects or {}).items():
+        _WORKER[key] = None, obj
+
+
+def _chunks(tasks, chunk_size):
+
+    starts = range(0, len(tasks), chunk_size)
+
+    return [tasks[start:stop] for start, stop in zip(starts, [*starts[1:], len(tasks)])]
+
+
+################################## BORUTA ##################################
+
+
+def boruta_ranking(X, y, seed, params):
+    """Boruta ranking of the features of one shard for the seed ``seed``"""
+
+    # Parallelism comes from the shards, each forest gets the threads of its worker
+    model = RandomForestClassifier(**{**params, "n_jobs": estimator_threads()})
+
+    feat_selector = BorutaPy(model, n_estimators="auto", random_state=seed)
+
+    feat_selector.fit(X, y)
+
+    return feat_selector.ranking_
+
+
+def _boruta_task(tasks, params):
+
+    X = _WORKER["X"][1]
+    y = _WORKER["y"][1]
+    rankings = _WORKER["rankings"][1]
+
+    for seed_idx, seed, shard_idx, start, stop in tasks:
+        rankings[seed_idx, shard_idx] = boruta_ranking(X[start:stop], y[start:stop], seed, params)
+
+    return len(tasks)
+
+
+def boruta_experiment(
+    X_list, y_list, seeds, params, n_workers=-1, chunk_size=10, progress=True, cores=None
+):
+    """Boruta rankings for every seed and shard, computed in a process pool.
+
+    The shards are concatenated into shared memory once and the workers write their rankings
+    straight into a preallocated shared ``(n_seeds, n_shards, n_features)`` array, which is
+    returned. ``params`` are the ``RandomForestClassifier`` parameters used inside Boruta.
+    The workers split ``cores`` (see ``resources.allocate``).
+    """
+
+    n_workers, n_threads = allocate(n_workers, cores)
+
+    seeds = list(seeds)
+    offsets = np.cumsum([0] + [len(X) for X in X_list])
+    n_features = X_list[0].shape[1]
+
+    blocks = {}
+
+    try:
+        blocks["X"], X_spec = _share(np.concatenate([np.asarray(X) for X in X_list]))
+        blocks["y"], y_spec = _share(np.concatenate([np.asarray(y).ravel() for y in y_list]))
+        blocks["rankings"], rankings_spec = _share(
+            np.zeros((len(seeds), len(X_list), n_features), dtype=np.int32)
+        )
+
+        tasks = [
+            (seed_idx, seed, shard_idx, offsets[shard_idx], offsets[shard_idx + 1])
+            for seed_idx, seed in enumerate(seeds)
+            for shard_idx in range(len(X_list))
+        ]
+        chunks = _chunks(tasks, chunk_size)
+
+        specs = {"X": X_spec, "y": y_spec, "rankings": rankings_spec}
+
+        pool = ProcessPoolExecutor(
+            n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(specs, n_threads),
+        )
+
+        with pool:
+
+            futures = [pool.submit(_boruta_task, chunk, params) for chunk in chunks]
+
+            with tqdm(total=len(tasks), disable=not progress) as bar:
+                for future in as_completed(futures):
+                    bar.update(future.result())
+
+        _, shape, dtype = rankings_spec
+
+        return np.ndarray(shape, dtype, buffer=blocks["rankings"].buf).copy()
+
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+############################ IMPURITY IMPORTANCE ############################
+
+
+def importance_estimation(X, y, pipe):
+    """``feature_importances_`` of the ``classifier`` step of ``pipe`` fitted on one shard"""
+
+    model = limit_n_jobs(clone(pipe)).fit(X, y)
+
+    return model.named_steps["classifier"].feature_importances_
+
+
+def _importance_task(tasks, pipe, feature_names, data=None):
+
+    if data is None:
+        data = {key: array for key, (_, array) in _WORKER.items()}
+
+    X, y = data["X"], data["y"]
+
+    # One frame over the whole matrix; shards are row slices of it, not rebuilt frames
+    if feature_names is not None and not isinstance(X, pd.DataFrame):
+        X = pd.DataFrame(X, columns=feature_names, copy=False)
+
+    rows = X.iloc if isinstance(X, pd.DataFrame) else X
+
+    importances = [
+        importance_estimation(rows[start:stop], y[start:stop], pipe) for _, start, stop in tasks
+    ]
+
+    return tasks[0][0], np.vstack(importances)
+
+
+def importance_experiment(
+    X_list,
+    y_list,
+    pipe,
+    backend="processes",
+    n_workers=-1,
+    chunk_size=10,
+    feature_names=None,
+    progress=True,
+    cores=None,
+):
+    """Feature importances of ``pipe`` fitted on every shard, as one ``(n_shards, n_features)`` array.
+
+    ``backend`` is ``"processes"`` (the shards are shared with a spawned process pool through
+    shared memory) or ``"threads"`` (tree fitting releases the GIL). Shards are dispatched in
+    chunks of ``chunk_size``. DataFrame shards keep their columns and dtypes; pass
+    ``feature_names`` for array shards when ``pipe`` selects columns by name. Numeric shards go
+    through shared memory, others (text columns) are pickled once per worker process. The
+    workers split ``cores`` (see ``resources.allocate``).
+    """
+
+    if backend not in ("processes", "threads"):
+        raise ValueError(f"Unknown backend {backend!r}, use 'processes' or 'threads'")
+
+    n_workers, n_threads = allocate(n_workers, cores)
+
+    offsets = np.cumsum([0] + [len(X) for X in X_list])
+    y = np.concatenate([np.asarray(y).ravel() for y in y_list])
+
+    if isinstance(X_list[0], pd.DataFrame):
+        X = pd.concat(X_list, ignore_index=True)
+        feature_names = list(X.columns)
+    else:
+        X = np.concatenate([np.asarray(X) for X in X_list])
+
+    tasks = [(i, offsets[i], offsets[i + 1]) for i in range(len(X_list))]
+    chunks = _chunks(tasks, chunk_size)
+
+    blocks = {}
+
+    try:
+        if backend == "processes":
+            specs, objects = {}, {}
+            shared = np.asarray(X)
+
+            if shared.dtype.hasobject:
+                objects["X"] = X
+            else:
+                blocks["X"], specs["X"] = _share(shared)
+
+            blocks["y"], specs["y"] = _share(y)
+
+            pool = ProcessPoolExecutor(
+                n_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(specs, n_threads, objects),
+            )
+            data = None
+        else:
+            pool = ThreadPoolExecutor(n_workers)
+            data = {"X": X, "y": y}
+
+        importances = None
+
+        # Thread workers share this process, so its limits are theirs
+        with pool, limited_threads(n_threads):
+
+            futures = [
+                pool.submit(_importance_task, chunk, pipe, feature_names, data) for chunk in chunks
+            ]
+
+            with tqdm(total=len(tasks), disable=not progress) as bar:
+                for future in as_completed(futures):
+                    start, chunk_importances = future.result()
+
+                    # The width is only known once the pipeline's preprocessing has run
+                    if importances is None:
+                        importances = np.empty((len(tasks), chunk_importances.shape[1]))
+
+                    stop = start + len(chunk_importances)
+                    importances[start:stop] = chunk_importances
+                    bar.update(len(chunk_importances))
+
+        return importances
+
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
@@ -0,0 +1,88 @@
+"""Memoization of objective values across trials that propose the same configuration
+
+Small integer search spaces make TPE propose configurations it has already evaluated. Each trial
+stores a hash of its pipeline configuration, the preprocessed data and the cross-validation
+definition as the ``memo_key`` user attribute, so the memo lives in the study storage and is
+shared by every worker and later run. A trial whose key was already completed returns the stored
+values without fitting anything; one whose key was pruned is pruned again.
+"""
+
+import joblib
+import optuna
+from optuna.trial import TrialState
+
+from mineral_prospect.modeling.fold_cache import config_key
+from mineral_prospect.modeling.profiling import stage
+from mineral_prospect.modeling.pruning import FOLD_AUC_ATTR
+
+MEMO_KEY_ATTR = "memo_key"
+MEMO_HIT_ATTR = "memo_hit"
+
+
+class ObjectiveMemo:
+    """Looks up trials of the same study with the same estimator on the same folds.
+
+    ``fold_cache`` is the ``FoldCache`` the folds come from and ``cv`` the splitter used to make
+    them; together with the estimator configuration they make up the key.
+    """
+
+    def __init__(self, fold_cache, cv):
+
+        self._base_key = joblib.hash((fold_cache.key, repr(cv)))
+
+        self._index = {}
+        self._seen = set()
+
+    def key(self, estimator):
+        """Hash of ``estimator``'s configuration on these folds"""
+
+        return joblib.hash((self._base_key, config_key(estimator)))
+
+    def lookup(self, trial, estimator):
+        """Stored values of an earlier trial with the same key, or ``None`` if there is none
+
+        The key is recorded on ``trial`` either way. Raises ``TrialPruned`` when the earlier
+        trial was pruned.
+        """
+
+        with stage("memo"):
+            key = self.key(estimator)
+            trial.set_user_attr(MEMO_KEY_ATTR, key)
+            self._update(trial.study)
+
+        if key not in self._index:
+            return None
+
+        original = self._index[key]
+        trial.set_user_attr(MEMO_HIT_ATTR, original.number)
+
+        if original.state == TrialState.PRUNED:
+            raise optuna.TrialPruned(f"Same configuration as pruned trial {original.number}")
+
+        # Keeps the fold history of the hit available to the fold pruners
+        if FOLD_AUC_ATTR in original.user_attrs:
+            trial.set_user_attr(FOLD_AUC_ATTR, original.user_attrs[FOLD_AUC_ATTR])
+
+        return tuple(original.values)
+
+    def _update(self, study):
+
+        finished = study.get_trials(
+            deepcopy=False, states=(TrialState.COMPLETE, TrialState.PRUNED)
+        )
+
+        for t in finished:
+
+            if t.number in self._seen:
+                continue
+
+            self._seen.add(t.number)
+
+            key = t.user_attrs.get(MEMO_KEY_ATTR)
+
+            if key is None:
+                continue
+
+            # A completed trial takes precedence over pruned ones with the same key
+            if key not in self._index or self._index[key].state != TrialState.COMPLETE:
+                self._index[key] = t
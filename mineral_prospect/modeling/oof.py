@@ -0,0 +1,280 @@
+"""Out-of-fold predictions of every trial, and greedy ensemble selection over them
+
+``OOFStore.save`` keeps the validation probabilities of a complete trial on every fold as one
+float16 array, ``<root>/<folds key>/<study>/<trial number>.npy``. The folds key identifies the
+preprocessed data and the splitter (as in ``memo.ObjectiveMemo``), so the trials of every study
+scored on the same folds, e.g. the decision tree, random forest and XGBoost studies with ``RKF``,
+can be combined. The labels of the folds are kept once, in ``labels.npz``.
+
+``select_ensemble`` runs greedy ensemble selection with replacement (Caruana et al., 2004) on
+those arrays alone: starting from the best trial, it adds at every step the trial that gives the
+averaged probabilities the highest mean fold ROC-AUC, and keeps the best step. Nothing is
+refitted, but every step sorts the predictions of every candidate on every fold. The candidates
+are therefore compared on a stratified sample of at most ``--max-rows`` rows of each fold, and
+the ensemble after each step is scored on all the rows::
+
+    python -m mineral_prospect.modeling.oof oof --candidates 100 --iterations 50 --max-rows 2000
+
+50 steps over 100 candidates and 10 folds take about 0.3 s with 100 rows per fold, 7 s with
+2,000 and, sampled, 8 s with 20,000 (one core).
+
+float16 keeps about three significant digits, so ROC-AUCs recomputed from the store can differ
+slightly from those of the trials (close probabilities become ties).
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from mineral_prospect.modeling.profiling import stage
+
+LABELS = "labels.npz"
+
+
+class OOFStore:
+    """Out-of-fold predictions of the trials scored on the folds of ``cv`` from ``fold_cache``"""
+
+    def __init__(self, fold_cache, cv, root):
+
+        self.key = joblib.hash((fold_cache.key, repr(cv)))
+        self.path = Path(root) / self.key
+
+        y_valid = [fold[3] for fold in fold_cache.split(cv)]
+        self.sizes = [len(y) for y in y_valid]
+
+        if not (self.path / LABELS).exists():
+            self._save_labels(y_valid)
+
+    def _save_labels(self, y_valid):
+
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = self.path / f"labels.{os.getpid()}.tmp"
+
+        with open(tmp_path, "wb") as file:
+            np.savez(
+                file,
+                y=np.concatenate(y_valid).astype(np.int8),
+                offsets=np.cumsum([0] + self.sizes),
+            )
+
+        os.replace(tmp_path, self.path / LABELS)
+
+    def save(self, trial, predictions):
+        """Stores the validation probabilities of ``trial``, one array per fold"""
+
+        if [len(proba) for proba in predictions] != self.sizes:
+            raise ValueError("The predictions do not match the validation sets of the folds")
+
+        with stage("save_oof"):
+            directory = self.path / trial.study.study_name
+            directory.mkdir(parents=True, exist_ok=True)
+
+            # Written under a temporary name so concurrent readers never see a partial file
+            tmp_path = directory / f"{trial.number}.{os.getpid()}.tmp"
+
+            with open(tmp_path, "wb") as file:
+                np.save(file, np.concatenate(predictions).astype(np.float16))
+
+            os.replace(tmp_path, directory / f"{trial.number}.npy")
+
+
+def load_oof(path, studies=None):
+    """``(y, offsets, members, P)`` of the folds stored at ``path`` (``<root>/<folds key>``).
+
+    ``y`` are the labels of all the validation sets, fold ``i`` being ``offsets[i]`` to
+    ``offsets[i + 1]``. Row ``j`` of ``P`` (float32) holds the predictions of the trial in row
+    ``j`` of the ``members`` DataFrame (``study``, ``trial``).
+    """
+
+    path = Path(path)
+
+    with np.load(path / LABELS) as labels:
+        y, offsets = labels["y"], labels["offsets"]
+
+    members, arrays = [], []
+
+    for directory in sorted(entry for entry in path.iterdir() if entry.is_dir()):
+
+        if studies is not None and directory.name not in studies:
+            continue
+
+        for file in sorted(directory.glob("*.npy"), key=lambda file: int(file.stem)):
+            members.append((directory.name, int(file.stem)))
+            arrays.append(np.load(file))
+
+    if not arrays:
+        raise FileNotFoundError(f"No out-of-fold predictions in {path}")
+
+    members = pd.DataFrame(members, columns=["study", "trial"])
+
+    return y, offsets, members, np.array(arrays, dtype=np.float32)
+
+
+def roc_auc(positive, S):
+    """ROC-AUC of every row of ``S`` for the boolean labels ``positive``, ties counted as half"""
+
+    n_models, n_rows = S.shape
+
+    order = np.argsort(S, axis=1)
+    values = np.take_along_axis(S, order, axis=1).ravel()
+    labels = positive[order].ravel()
+
+    # Mann-Whitney U from one sort of all the rows: tied scores share the mid rank of their run
+    cells = np.arange(values.size)
+    starts = np.flatnonzero((np.diff(values, prepend=np.nan) != 0) | (cells % n_rows == 0))
+    lengths = np.diff(starts, append=values.size)
+    mid_ranks = starts % n_rows + (lengths + 1) / 2
+
+    positive_ranks = np.bincount(
+        starts // n_rows,
+        weights=np.add.reduceat(labels, starts) * mid_ranks,
+        minlength=n_models,
+    )
+
+    n_positive = positive.sum()
+    n_negative = n_rows - n_positive
+
+    return (positive_ranks - n_positive * (n_positive + 1) / 2) / (n_positive * n_negative)
+
+
+def fold_roc_auc(y, offsets, P):
+    """``(n_models, n_folds)`` ROC-AUC of every row of ``P`` on every fold"""
+
+    scores = np.empty((len(P), len(offsets) - 1))
+
+    for i, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:])):
+        scores[:, i] = roc_auc(y[start:stop] == 1, P[:, start:stop])
+
+    return scores
+
+
+def sample_folds(y, offsets, max_rows, seed=0):
+    """``(rows, offsets)`` of a stratified sample of at most ``max_rows`` rows of every fold"""
+
+    rng = np.random.default_rng(seed)
+    rows = []
+
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+
+        fold = np.arange(start, stop)
+
+        if len(fold) > max_rows:
+            fold = np.concatenate(
+                [
+                    rng.choice(
+                        fold[y[fold] == label],
+                        round(max_rows * np.mean(y[fold] == label)),
+                        replace=False,
+                    )
+                    for label in (0, 1)
+                ]
+            )
+
+        rows.append(np.sort(fold))
+
+    return np.concatenate(rows), np.cumsum([0] + [len(fold) for fold in rows])
+
+
+def greedy_selection(y, offsets, P, n_iterations=50, max_rows=None, seed=0):
+    """Greedy ensemble selection with replacement over the rows of ``P``.
+
+    With ``max_rows``, the candidates are compared at every step on the same stratified sample of
+    at most ``max_rows`` rows of each fold. Returns how many times each row is in the best
+    ensemble found, and the fold ROC-AUCs (on all rows) of the ensemble after each step, an
+    ``(n_iterations, n_folds)`` array.
+    """
+
+    sampled = max_rows is not None and np.diff(offsets).max() > max_rows
+    rows, sample_offsets = sample_folds(y, offsets, max_rows, seed) if sampled else (..., offsets)
+
+    P_sample = P[:, rows]
+    y_sample = y[rows]
+
+    counts = np.zeros(len(P), dtype=int)
+    best_counts, best_mean = counts.copy(), -np.inf
+    total = np.zeros(P.shape[1], dtype=np.float64)
+    history = []
+
+    for _ in range(n_iterations):
+
+        # Dividing by the ensemble size would not change the ranks
+        scores = fold_roc_auc(y_sample, sample_offsets, total[rows] + P_sample)
+        best = np.argmax(scores.mean(axis=1))
+
+        counts[best] += 1
+        total += P[best]
+        history.append(fold_roc_auc(y, offsets, total[None])[0] if sampled else scores[best])
+
+        if history[-1].mean() > best_mean:
+            best_counts, best_mean = counts.copy(), history[-1].mean()
+
+    return best_counts, np.array(history)
+
+
+def select_ensemble(path, studies=None, n_candidates=100, n_iterations=50, max_rows=2000):
+    """Greedy ensemble of the ``n_candidates`` best trials stored at ``path``.
+
+    At most ``max_rows`` rows of each fold (all if None) are used to choose the members, see
+    ``greedy_selection``. Returns the members (study, trial, weight and their own mean and std
+    fold ROC-AUC) and the mean and std fold ROC-AUC of the ensemble after each step.
+    """
+
+    y, offsets, members, P = load_oof(path, studies)
+
+    own = fold_roc_auc(y, offsets, P)
+    candidates = np.argsort(-own.mean(axis=1), kind="stable")[:n_candidates]
+
+    counts, history = greedy_selection(y, offsets, P[candidates], n_iterations, max_rows)
+
+    chosen = candidates[counts > 0]
+    ensemble = members.iloc[chosen].assign(
+        weight=counts[counts > 0] / counts.sum(),
+        mean_auc=own[chosen].mean(axis=1),
+        std_auc=own[chosen].std(axis=1),
+    )
+
+    steps = pd.DataFrame(
+        {"mean_auc": history.mean(axis=1), "std_auc": history.std(axis=1)},
+        index=pd.RangeIndex(1, len(history) + 1, name="step"),
+    )
+
+    return ensemble.sort_values("weight", ascending=False, ignore_index=True), steps
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Greedy ensemble of the stored trials")
+    parser.add_argument("root", type=Path, help="out-of-fold store, e.g. oof")
+    parser.add_argument("--key", help="folds key, needed when the store has several")
+    parser.add_argument("--study", action="append", dest="studies")
+    parser.add_argument("--candidates", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument(
+        "--max-rows", type=int, default=2000, help="rows per fold to choose members (0: all)"
+    )
+
+    args = parser.parse_args()
+
+    keys = sorted(path.parent.name for path in args.root.glob(f"*/{LABELS}"))
+
+    if args.key is None and len(keys) != 1:
+        parser.error(f"Pass --key, one of {keys}")
+
+    path = args.root / (args.key or keys[0])
+    ensemble, steps = select_ensemble(
+        path, args.studies, args.candidates, args.iterations, args.max_rows or None
+    )
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(ensemble.round(4))
+        print()
+        print(steps.iloc[[0, steps["mean_auc"].idxmax() - 1, -1]].round(4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Batch scoring of candidate prospects with a fitted pipeline"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from mineral_prospect.config import CATEGORY_GROUPS, MIN_TIR
+from mineral_prospect.features import BASE_FEATURES, NUMERIC_FEATURES, numeric_features
+from mineral_prospect.modeling.artifact import load_artifact
+
+SCORE_COLUMN = f"P_TIR_LT_{MIN_TIR}"
+
+
+class ProspectScorer:
+    """Probability that ``TIR < MIN_TIR`` for candidate prospects, from a fitted pipeline.
+
+    The candidates need the columns the pipeline was fitted on. Derived and ``LOG_10_`` columns
+    that are missing are computed from ``features.BASE_FEATURES`` (grades as fractions).
+    """
+
+    def __init__(self, model):
+
+        self.model = model
+        self.feature_names = list(model.feature_names_in_)
+        self._positive = list(model.classes_).index(True)
+
+        self._derived = [col for col in self.feature_names if col in NUMERIC_FEATURES]
+
+    @classmethod
+    def load(cls, path, compiled=False):
+        """Scorer of a pipeline saved with ``train.save_model`` or of an artifact directory.
+
+        ``compiled`` scores an artifact with its compiled trees, only faster for small batches.
+        """
+
+        if Path(path).is_dir():
+            return cls(load_artifact(path, compiled=compiled))
+
+        return cls(joblib.load(path))
+
+    def input_columns(self, available):
+        """Columns of ``available`` needed to score"""
+
+        needed = set(self.feature_names)
+
+        if not needed <= set(available):
+            needed |= set(BASE_FEATURES)
+
+        return [col for col in available if col in needed]
+
+    def score(self, df):
+        """``SCORE_COLUMN`` probabilities of the rows of ``df``"""
+
+        missing = [col for col in self._derived if col not in df.columns]
+
+        if missing:
+            numeric = pd.DataFrame(numeric_features(df), columns=NUMERIC_FEATURES, index=df.index)
+            df = df.assign(**numeric[missing])
+
+        # Raw candidates still have the rare categories that were merged for training
+        grouped = [col for col in CATEGORY_GROUPS if col in self.feature_names]
+        df = df.assign(**{col: df[col].replace(CATEGORY_GROUPS[col]) for col in grouped})
+
+        return self.model.predict_proba(df[self.feature_names])[:, self._positive]
+
+    def score_file(self, source, target, chunk_size=100_000, id_columns=(), progress=True):
+        """Scores a CSV or Parquet file in chunks and writes ``id_columns`` + ``SCORE_COLUMN``.
+
+        The output format follows the extension of ``target``. Returns the number of rows scored
+        and the elapsed seconds.
+        """
+
+        source, target = Path(source), Path(target)
+
+        start = time.perf_counter()
+        n_rows = 0
+        writer = None
+
+        try:
+            for chunk in self._chunks(source, chunk_size, id_columns):
+
+                scores = pd.DataFrame(
+                    {**{col: chunk[col] for col in id_columns}, SCORE_COLUMN: self.score(chunk)}
+                )
+                writer = _write(scores, target, writer)
+                n_rows += len(chunk)
+
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    print(f"{n_rows} rows, {n_rows / elapsed:.0f} rows/s", file=sys.stderr)
+
+        finally:
+            if isinstance(writer, pq.ParquetWriter):
+                writer.close()
+
+        return n_rows, time.perf_counter() - start
+
+    def _chunks(self, source, chunk_size, id_columns):
+
+        if source.suffix == ".parquet":
+            parquet = pq.ParquetFile(source)
+            header = parquet.schema_arrow.names
+        else:
+            header = pd.read_csv(source, nrows=0).columns
+
+        missing = [col for col in id_columns if col not in header]
+
+        if missing:
+            raise ValueError(f"Id columns {missing} are not in {source}")
+
+        columns = self.input_columns(header)
+        columns += [col for col in id_columns if col not in columns]
+
+        if source.suffix == ".parquet":
+            for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(source, usecols=columns, chunksize=chunk_size)
+
+
+def _write(scores, target, writer):
+
+    if target.suffix == ".parquet":
+        table = pa.Table.from_pandas(scores, preserve_index=False)
+        writer = writer or pq.ParquetWriter(target, table.schema)
+        writer.write_table(table)
+        return writer
+
+    scores.to_csv(target, mode="a" if writer else "w", header=not writer, index=False)
+
+    return True
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=f"Scores candidate prospects ({SCORE_COLUMN})")
+    parser.add_argument(
+        "model", type=Path, help="pipeline saved by train.save_model, or artifact directory"
+    )
+    parser.add_argument("candidates", type=Path, help="CSV or Parquet file of candidates")
+    parser.add_argument("output", type=Path, help="CSV or Parquet file for the scores")
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--id-columns", nargs="*", default=[], help="columns copied to the output")
+    parser.add_argument(
+        "--compiled", action="store_true", help="score an artifact with its compiled trees"
+    )
+
+    args = parser.parse_args()
+
+    scorer = ProspectScorer.load(args.model, compiled=args.compiled)
+    n_rows, seconds = scorer.score_file(
+        args.candidates, args.output, args.chunk_size, args.id_columns
+    )
+
+    print(f"Scored {n_rows} rows in {seconds:.1f} s ({n_rows / max(seconds, 1e-9):.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Fold-level pruning for the two-objective (mean, log10 std) ROC-AUC studies
+
+``Trial.report`` and optuna's pruners only support single-objective studies, so the running mean
+ROC-AUC after each cross-validation fold is stored as the ``fold_auc`` user attribute instead,
+and the pruners below compare it with the values other trials had after the same fold: complete
+trials, as optuna's ``MedianPruner`` does, and also pruned ones for successive halving, whose
+rungs hold every trial that reached them. Only the mean is used to prune: the standard deviation
+is not meaningful after a few folds.
+"""
+
+import math
+from abc import ABC, abstractmethod
+
+import numpy as np
+import optuna
+from optuna.trial import TrialState
+
+FOLD_AUC_ATTR = "fold_auc"
+
+
+class FoldPruner(ABC):
+    """Base class: records the running mean after each fold and raises ``TrialPruned``"""
+
+    # Trials whose running means are compared
+    states = (TrialState.COMPLETE,)
+
+    def __init__(self, n_startup_trials=20, min_folds=2):
+
+        self.n_startup_trials = n_startup_trials
+        self.min_folds = min_folds
+
+        self._history = None
+        self._history_trial = None
+
+    def report(self, trial, scores):
+        """Stores the running mean of ``scores`` and prunes the trial if it is hopeless"""
+
+        step = len(scores)
+        value = float(np.mean(scores))
+
+        history = trial.user_attrs.get(FOLD_AUC_ATTR, [])
+        trial.set_user_attr(FOLD_AUC_ATTR, history + [value])
+
+        if step < self.min_folds:
+            return
+
+        others = self._values_at(trial, step)
+
+        if len(others) >= self.n_startup_trials and self.should_prune(value, others, step):
+            raise optuna.TrialPruned(f"Pruned after {step} folds with mean ROC-AUC {value:.4f}")
+
+    @abstractmethod
+    def should_prune(self, value, others, step):
+        """Whether ``value`` after ``step`` folds is hopeless compared with ``others``"""
+
+    def _values_at(self, trial, step):
+
+        # Finished trials are read once per trial rather than once per fold
+        if self._history_trial != trial.number:
+            finished = trial.study.get_trials(deepcopy=False, states=self.states)
+            self._history = [
+                t.user_attrs[FOLD_AUC_ATTR] for t in finished if FOLD_AUC_ATTR in t.user_attrs
+            ]
+            self._history_trial = trial.number
+
+        return np.array([values[step - 1] for values in self._history if len(values) >= step])
+
+
+class NopFoldPruner(FoldPruner):
+    """Only records the running means"""
+
+    def should_prune(self, value, others, step):
+
+        return False
+
+
+class MedianFoldPruner(FoldPruner):
+    """Prunes when the running mean is below the ``percentile`` of the other trials at that fold"""
+
+    def __init__(self, n_startup_trials=20, min_folds=2, percentile=50.0):
+
+        super().__init__(n_startup_trials=n_startup_trials, min_folds=min_folds)
+        self.percentile = percentile
+
+    def should_prune(self, value, others, step):
+
+        return value < np.percentile(others, self.percentile)
+
+
+class SuccessiveHalvingFoldPruner(FoldPruner):
+    """Asynchronous successive halving with folds as the resource.
+
+    Rungs are at ``min_folds * reduction_factor**k`` folds; at each rung only the best
+    ``1 / reduction_factor`` of the trials that reached it carry on.
+    """
+
+    states = (TrialState.COMPLETE, TrialState.PRUNED)
+
+    def __init__(self, n_startup_trials=20, min_folds=2, reduction_factor=3):
+
+        super().__init__(n_startup_trials=n_startup_trials, min_folds=min_folds)
+        self.reduction_factor = reduction_factor
+
+    def should_prune(self, value, others, step):
+
+        rung = math.log(step / self.min_folds, self.reduction_factor)
+
+        if not math.isclose(rung, round(rung)):
+            return False
+
+        n_promoted = math.ceil((len(others) + 1) / self.reduction_factor)
+        threshold = np.sort(np.append(others, value))[::-1][n_promoted - 1]
+
+        return value < threshold
@@ -0,0 +1,109 @@
+"""Resampling computed once per (fold, seed) and replayed inside the imblearn pipelines"""
+
+import os
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.base import BaseEstimator, clone
+
+from mineral_prospect.modeling.fold_cache import config_key
+from mineral_prospect.modeling.profiling import stage
+
+# Resampled folds of this process, shared by every clone of a CachedResampler
+_MEMORY = {}
+
+
+class CachedResampler(BaseEstimator):
+    """Sampler step that replays the output of ``steps`` (e.g. SMOTE then RandomUnderSampler).
+
+    Every sampler in ``steps`` is seeded with ``seed``, so the resampled training set of a fold
+    is the same for every trial. It is computed the first time the fold is seen and stored
+    compactly: the rows the samplers kept are indices into the fold, only the synthetic rows are
+    stored as values. With ``cache_dir`` the entries are ``.npz`` files shared by other
+    processes and later runs.
+    """
+
+    def __init__(self, steps, seed=0, cache_dir=None):
+
+        self.steps = steps
+        self.seed = seed
+        self.cache_dir = cache_dir
+
+    def fit(self, X, y):
+
+        return self
+
+    def fit_resample(self, X, y):
+
+        with stage("resample"):
+            return self._fit_resample(X, y)
+
+    def _fit_resample(self, X, y):
+
+        X = np.asarray(X)
+        y = np.asarray(y).ravel()
+
+        key = joblib.hash(([config_key(sampler) for _, sampler in self.steps], self.seed, X, y))
+
+        if key not in _MEMORY:
+            _MEMORY[key] = self._load(key) or self._resample(key, X, y)
+
+        source, synthetic, y_res = _MEMORY[key]
+
+        return np.concatenate([X, synthetic])[source], y_res
+
+    def precompute(self, folds):
+        """Resamples the training part of every ``(X_train, y_train, X_valid, y_valid)`` fold"""
+
+        for X_train, y_train, _, _ in folds:
+            self.fit_resample(X_train, y_train)
+
+        return self
+
+    def _resample(self, key, X, y):
+
+        X_res, y_res = X, y
+
+        for _, sampler in self.steps:
+            sampler = clone(sampler)
+            if "random_state" in sampler.get_params():
+                sampler.set_params(random_state=self.seed)
+            with stage(type(sampler).__name__):
+                X_res, y_res = sampler.fit_resample(X_res, y_res)
+
+        # Output rows found in the fold are stored as indices, the others as synthetic rows
+        positions = {row.tobytes(): i for i, row in reversed(list(enumerate(X)))}
+        source = np.array([positions.get(row.tobytes(), -1) for row in X_res], dtype=np.int32)
+
+        is_synthetic = source < 0
+        source[is_synthetic] = len(X) + np.arange(is_synthetic.sum())
+
+        entry = (source, X_res[is_synthetic], np.asarray(y_res))
+
+        if self.cache_dir is not None:
+            self._save(key, entry)
+
+        return entry
+
+    def _path(self, key):
+
+        return Path(self.cache_dir) / f"{key}.npz"
+
+    def _load(self, key):
+
+        if self.cache_dir is None or not self._path(key).exists():
+            return None
+
+        with np.load(self._path(key)) as data:
+            return (data["source"], data["synthetic"], data["y"])
+
+    def _save(self, key, entry):
+
+        Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+
+        # Written under a temporary name so concurrent readers never see a partial file
+        tmp_path = Path(self.cache_dir) / f"{key}.{os.getpid()}.tmp.npz"
+        source, synthetic, y = entry
+        np.savez(tmp_path, source=source, synthetic=synthetic, y=y)
+        os.replace(tmp_path, self._path(key))
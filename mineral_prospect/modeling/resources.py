@@ -0,0 +1,137 @@
+"""Core budget shared by study workers, estimator threads and OpenMP/BLAS pools
+
+Every level of parallelism defaults to every core: worker processes (``n_workers=-1``), estimator
+threads (XGBoost with ``n_jobs=None``, any ``n_jobs=-1``) and the OpenMP/BLAS pools of NumPy,
+SciPy, scikit-learn and XGBoost. Nested, they run ``cores ** 2`` threads. Here one budget is split
+instead: ``allocate`` gives each of the workers ``budget // workers`` threads and
+``limited_threads`` caps every pool of a worker at its share.
+
+The budget is the ``cores`` argument of the runners, else the ``MINERAL_PROSPECT_CORES`` environment
+variable, else the cores this process may run on::
+
+    MINERAL_PROSPECT_CORES=32 python random_forest_optm.py
+"""
+
+import os
+from contextlib import contextmanager
+
+from threadpoolctl import threadpool_limits
+
+CORES_ENV = "MINERAL_PROSPECT_CORES"
+
+# Read when the OpenMP/BLAS libraries are loaded, so spawned workers start with their share
+THREAD_ENV = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+# Threads of each worker of this process, None outside ``limited_threads``
+_THREADS = None
+
+
+def core_budget(cores=None):
+    """Total number of cores, see the module docstring"""
+
+    if cores is None:
+        cores = os.environ.get(CORES_ENV)
+
+    if cores is None:
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count()
+
+    cores = int(cores)
+
+    if cores < 1:
+        raise ValueError(f"The core budget must be positive, got {cores}")
+
+    return cores
+
+
+def allocate(n_workers=-1, cores=None):
+    """``(workers, threads)``: ``n_workers`` (all the budget if negative) and threads per worker"""
+
+    budget = core_budget(cores)
+
+    workers = budget if n_workers < 0 else min(n_workers, budget)
+
+    return workers, max(1, budget // workers)
+
+
+def estimator_threads():
+    """Threads an estimator may use in this process: its share, or the whole budget"""
+
+    return _THREADS if _THREADS is not None else core_budget()
+
+
+def limit_n_jobs(estimator, n_threads=None):
+    """Caps the ``n_jobs`` of ``estimator`` and its steps at ``n_threads`` (``estimator_threads``).
+
+    Negative values and larger ones are capped, and so is ``None`` for XGBoost models, which then
+    use every core. Other ``None`` values (one job in scikit-learn) are kept. Returns ``estimator``.
+    """
+
+    if n_threads is None:
+        n_threads = estimator_threads()
+
+    params = estimator.get_params()
+    capped = {}
+
+    for key, value in params.items():
+
+        if key.rsplit("__", 1)[-1] != "n_jobs":
+            continue
+
+        owner = params[key.rsplit("__", 1)[0]] if "__" in key else estimator
+
+        if value is None:
+            if type(owner).__module__.startswith("xgboost"):
+                capped[key] = n_threads
+        elif value < 0 or value > n_threads:
+            capped[key] = n_threads
+
+    return estimator.set_params(**capped)
+
+
+def limit_threads(n_threads):
+    """Caps the thread pools of this process at ``n_threads`` for good (pool initializers)"""
+
+    global _THREADS
+
+    _THREADS = n_threads
+    os.environ.update({name: str(n_threads) for name in THREAD_ENV})
+
+    threadpool_limits(n_threads)
+
+
+@contextmanager
+def limited_threads(n_threads):
+    """``limit_threads`` for the enclosed block only.
+
+    Processes spawned inside the block inherit the limits through their environment.
+    """
+
+    global _THREADS
+
+    previous = _THREADS, {name: os.environ.get(name) for name in THREAD_ENV}
+
+    _THREADS = n_threads
+    os.environ.update({name: str(n_threads) for name in THREAD_ENV})
+
+    try:
+        with threadpool_limits(n_threads):
+            yield
+
+    finally:
+        _THREADS, environment = previous
+
+        for name, value in environment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
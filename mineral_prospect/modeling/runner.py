@@ -0,0 +1,122 @@
+"""Multi-process study runner
+
+``study.optimize(..., n_jobs=-1)`` runs trials as threads of one interpreter, so the GIL-bound
+parts of the sklearn/imblearn pipelines serialize. Here every worker is a separate process that
+loads the study from the shared storage and pulls trials until the study reaches its budget.
+The workers split the core budget (``resources.core_budget``) and cap their estimator, OpenMP
+and BLAS threads at their share.
+"""
+
+import multiprocessing
+
+import optuna
+
+from mineral_prospect.modeling.convergence import STOP_REASON_ATTR
+from mineral_prospect.modeling.resources import allocate, limited_threads
+from mineral_prospect.modeling.staged import GROWN_FROM_ATTR
+from mineral_prospect.modeling.storage import get_storage
+
+
+def optimize_in_processes(
+    study_name,
+    storage,
+    objective_factory,
+    n_trials,
+    sampler=None,
+    n_workers=-1,
+    cores=None,
+    callbacks=(),
+):
+    """Runs ``n_trials`` more trials of an existing study in ``n_workers`` processes.
+
+    ``objective_factory`` is called once inside each worker and must return the objective, so it
+    has to be picklable (a module-level function) and should load its own data. ``storage`` is a
+    URL understood by ``storage.get_storage`` (``sqlite:///...`` or ``journal:///...``). Every
+    worker gets its own copy of ``sampler`` with a fresh random seed. At most ``cores`` workers
+    run (see ``resources.allocate``), each with ``cores // n_workers`` threads. ``callbacks``
+    (e.g. ``convergence.HypervolumeStop``) are picklable study callbacks run in every worker.
+    """
+
+    n_workers, n_threads = allocate(n_workers, cores)
+
+    study = optuna.load_study(study_name=study_name, storage=get_storage(storage))
+    max_trials = _n_sampled(study) + n_trials
+
+    # Spawned workers never inherit open database connections or threads from this process
+    context = multiprocessing.get_context("spawn")
+
+    workers = [
+        context.Process(
+            target=_worker,
+            args=(
+                study_name,
+                storage,
+                objective_factory,
+                sampler,
+                max_trials,
+                n_threads,
+                list(callbacks),
+            ),
+        )
+        for _ in range(n_workers)
+    ]
+
+    # Started inside the limits so the OpenMP/BLAS libraries load with the workers' share
+    with limited_threads(n_threads):
+        for worker in workers:
+            worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    failed = [worker.exitcode for worker in workers if worker.exitcode != 0]
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {n_workers} study workers failed: {failed}")
+
+    return optuna.load_study(study_name=study_name, storage=get_storage(storage))
+
+
+def _worker(study_name, storage, objective_factory, sampler, max_trials, n_threads, callbacks):
+
+    if sampler is not None:
+        sampler.reseed_rng()
+
+    with limited_threads(n_threads):
+
+        objective = objective_factory()
+
+        study = optuna.load_study(
+            study_name=study_name, storage=get_storage(storage), sampler=sampler
+        )
+
+        if _n_sampled(study) >= max_trials:
+            return
+
+        study.optimize(objective, callbacks=[_Budget(max_trials), *callbacks])
+
+
+def _n_sampled(study):
+
+    # Trials in every state, like ``n_trials`` counts for a single process, except the ones
+    # added by ``staged.add_size_trials``, which come for free with another trial's fit
+    trials = study.get_trials(deepcopy=False)
+
+    return sum(GROWN_FROM_ATTR not in trial.user_attrs for trial in trials)
+
+
+class _Budget:
+    """Stops the study once ``max_trials`` trials have been sampled"""
+
+    def __init__(self, max_trials):
+
+        self.max_trials = max_trials
+
+    def __call__(self, study, trial):
+
+        if _n_sampled(study) >= self.max_trials:
+            study.set_user_attr(
+                STOP_REASON_ATTR,
+                {"reason": "n_trials", "trial": trial.number, "max_trials": self.max_trials},
+            )
+            study.stop()
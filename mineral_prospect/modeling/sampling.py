@@ -0,0 +1,316 @@
+"""Sampler wrapper that keeps the cost of each suggestion bounded in long studies
+
+TPE reads the whole history for every suggestion and, with two objectives, ranks it by
+non-domination, so a suggestion late in a 10,000-trial study costs more than a decision tree
+trial. ``WindowedSampler`` shows the wrapped sampler a window of the history instead: the last
+``window`` finished trials plus ``n_quantiles`` older complete trials taken at evenly spaced ranks
+of their objective values (the best one included), and the running trials.
+
+- ``time_budget``: seconds of sampling per trial. Above it the window shrinks by 30% down to
+  ``min_window`` (keep it above the wrapped TPE's ``n_startup_trials``, or TPE falls back to
+  random sampling), below half of it the window grows back by 10% up to ``window``. The
+  independent parameters of a trial that already spent its budget are sampled at random.
+- ``batch_size``: suggestions served from one history snapshot. Idle workers that share the
+  sampler (``study.optimize(n_jobs=...)`` threads), and consecutive trials of a process, read
+  and window the finished trials once per batch. The running trials are read for every
+  suggestion, so ``constant_liar`` also steers away from the trials started since the snapshot.
+
+``recorded(objective)`` stores the sampling time of every trial and the history size it saw as
+the ``sampler`` user attribute, see ``sampler_report``::
+
+    python -m mineral_prospect.modeling.sampling journal:///random_forest.log random_forest
+"""
+
+import argparse
+import copy
+import functools
+import threading
+import time
+
+import numpy as np
+import optuna
+import pandas as pd
+from optuna.samplers import BaseSampler, RandomSampler
+from optuna.study import StudyDirection
+from optuna.trial import TrialState
+
+from mineral_prospect.modeling.storage import get_storage
+
+SAMPLER_ATTR = "sampler"
+
+
+class _HistoryView:
+    """The study, except that its trials are ``trials``"""
+
+    def __init__(self, study, trials):
+
+        self._study = study
+        self._trials = trials
+
+    def __getattr__(self, name):
+
+        return getattr(self._study, name)
+
+    def get_trials(self, deepcopy=True, states=None):
+
+        trials = self._trials
+        if states is not None:
+            trials = [trial for trial in trials if trial.state in states]
+
+        return copy.deepcopy(trials) if deepcopy else trials
+
+    def _get_trials(self, deepcopy=True, states=None, use_cache=False):
+
+        return self.get_trials(deepcopy=deepcopy, states=states)
+
+    @property
+    def trials(self):
+
+        return self.get_trials()
+
+
+def _rank_sum(trials, directions):
+
+    # Sum over the objectives of each trial's rank, 0 being the best
+    values = np.array([trial.values for trial in trials], dtype=float)
+    signs = np.array([-1.0 if d == StudyDirection.MAXIMIZE else 1.0 for d in directions])
+
+    return np.argsort(np.argsort(values * signs, axis=0), axis=0).sum(axis=1)
+
+
+class WindowedSampler(BaseSampler):
+    """``sampler`` with a bounded history, see the module docstring"""
+
+    def __init__(
+        self,
+        sampler,
+        window=1000,
+        n_quantiles=200,
+        time_budget=None,
+        min_window=200,
+        batch_size=1,
+        seed=None,
+    ):
+
+        self.sampler = sampler
+        self.max_window = window
+        self.min_window = min_window
+        self.window = window
+        self.n_quantiles = n_quantiles
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+
+        self._random = RandomSampler(seed)
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._served = 0
+        self._elapsed = {}
+        self._sizes = {}
+
+    def __getstate__(self):
+
+        # Worker processes start with a fresh snapshot and lock
+        state = self.__dict__.copy()
+        state.update(_lock=None, _snapshot=None, _served=0, _elapsed={}, _sizes={})
+
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def reseed_rng(self):
+
+        self.sampler.reseed_rng()
+        self._random.reseed_rng()
+
+    ############################## HISTORY ##############################
+
+    def history(self, study):
+        """The trials the wrapped sampler sees"""
+
+        trials = study.get_trials(deepcopy=False)
+
+        running = [trial for trial in trials if trial.state == TrialState.RUNNING]
+        finished = [
+            trial for trial in trials if trial.state in (TrialState.COMPLETE, TrialState.PRUNED)
+        ]
+
+        if len(finished) <= self.window + self.n_quantiles:
+            return finished + running
+
+        stop = len(finished) - self.window
+        older = [trial for trial in finished[:stop] if trial.state == TrialState.COMPLETE]
+
+        kept = []
+        if older and self.n_quantiles > 0:
+            order = np.argsort(_rank_sum(older, study.directions), kind="stable")
+            picks = np.unique(np.linspace(0, len(order) - 1, self.n_quantiles).round().astype(int))
+            kept = sorted((older[i] for i in order[picks]), key=lambda trial: trial.number)
+
+        return kept + finished[stop:] + running
+
+    def _view(self, study, trial):
+
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self.history(study)
+            snapshot = self._snapshot
+
+        # Trials started since the snapshot; the ones that finished meanwhile stay as running
+        seen = {t.number for t in snapshot}
+        started = [
+            t
+            for t in study.get_trials(deepcopy=False, states=(TrialState.RUNNING,))
+            if t.number not in seen
+        ]
+
+        with self._lock:
+            self._sizes[trial.number] = len(snapshot) + len(started)
+
+        return _HistoryView(study, snapshot + started)
+
+    def _timed(self, trial, function, *args):
+
+        start = time.perf_counter()
+
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self._elapsed[trial.number] = (
+                    self._elapsed.get(trial.number, 0.0) + time.perf_counter() - start
+                )
+
+    ############################## SAMPLING ##############################
+
+    def before_trial(self, study, trial):
+
+        with self._lock:
+            # A new snapshot every batch_size trials
+            if self._served >= self.batch_size:
+                self._snapshot = None
+                self._served = 0
+            self._served += 1
+
+        self._timed(trial, self.sampler.before_trial, study, trial)
+
+    def infer_relative_search_space(self, study, trial):
+
+        return self._timed(
+            trial, self.sampler.infer_relative_search_space, self._view(study, trial), trial
+        )
+
+    def sample_relative(self, study, trial, search_space):
+
+        return self._timed(
+            trial, self.sampler.sample_relative, self._view(study, trial), trial, search_space
+        )
+
+    def sample_independent(self, study, trial, param_name, param_distribution):
+
+        sampler = self.sampler
+
+        if (
+            self.time_budget is not None
+            and self._elapsed.get(trial.number, 0.0) > self.time_budget
+        ):
+            sampler = self._random
+
+        return self._timed(
+            trial,
+            sampler.sample_independent,
+            self._view(study, trial),
+            trial,
+            param_name,
+            param_distribution,
+        )
+
+    def after_trial(self, study, trial, state, values):
+
+        self.sampler.after_trial(study, trial, state, values)
+
+        with self._lock:
+            elapsed = self._elapsed.pop(trial.number, 0.0)
+            self._sizes.pop(trial.number, None)
+
+            if self.time_budget is not None:
+                if elapsed > self.time_budget:
+                    self.window = max(self.min_window, int(self.window * 0.7))
+                elif elapsed < self.time_budget / 2:
+                    self.window = min(self.max_window, int(self.window * 1.1) + 1)
+
+    def stats(self, number):
+        """Sampling seconds of trial ``number`` so far and the size of the history it saw"""
+
+        with self._lock:
+            return {"s": self._elapsed.get(number, 0.0), "history": self._sizes.get(number, 0)}
+
+
+def recorded(objective):
+    """``objective`` that stores ``WindowedSampler.stats`` as the ``sampler`` user attribute.
+
+    Every parameter is sampled before the objective returns, so the attribute is set on the
+    running trial, pruned or failed trials included. Does nothing for other samplers.
+    """
+
+    @functools.wraps(objective)
+    def wrapper(trial):
+
+        try:
+            return objective(trial)
+        finally:
+            sampler = trial.study.sampler
+            if isinstance(sampler, WindowedSampler):
+                trial.set_user_attr(SAMPLER_ATTR, sampler.stats(trial.number))
+
+    return wrapper
+
+
+def sampler_report(study, bins=10):
+    """Sampling seconds and history size per trial, summarized over ``bins`` trial-number ranges"""
+
+    rows = [
+        {"trial": trial.number, **trial.user_attrs[SAMPLER_ATTR]}
+        for trial in study.get_trials(deepcopy=False)
+        if SAMPLER_ATTR in trial.user_attrs
+    ]
+
+    if not rows:
+        return pd.DataFrame()
+
+    report = pd.DataFrame(rows)
+    report["trials"] = pd.cut(report["trial"], bins=min(bins, len(report)))
+
+    return report.groupby("trials", observed=True).agg(
+        n=("trial", "size"),
+        s_median=("s", "median"),
+        s_p95=("s", lambda s: s.quantile(0.95)),
+        s_total=("s", "sum"),
+        history_median=("history", "median"),
+    )
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Sampler time per trial of a study")
+    parser.add_argument("storage", help="e.g. journal:///random_forest.log")
+    parser.add_argument("study", help="study name")
+    parser.add_argument("--bins", type=int, default=10)
+
+    args = parser.parse_args()
+
+    study = optuna.load_study(study_name=args.study, storage=get_storage(args.storage))
+    report = sampler_report(study, args.bins)
+
+    if report.empty:
+        print(f"No sampler times in {args.study}")
+        return
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(report.round(4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""One ensemble fit scored at several ``n_estimators``
+
+The first ``k`` trees of a fitted random forest are the forest ``n_estimators=k`` would have
+grown with the same ``random_state``, and the first ``k`` boosting rounds of an XGBoost model are
+the model trained for ``k`` rounds. Fitting the largest ensemble once and scoring its prefixes
+therefore evaluates every smaller size exactly, and those evaluations are added to the study as
+extra trials.
+"""
+
+import numpy as np
+import optuna
+from sklearn.base import clone
+from sklearn.metrics import roc_auc_score
+
+from mineral_prospect.modeling.memo import MEMO_KEY_ATTR
+from mineral_prospect.modeling.profiling import stage
+from mineral_prospect.modeling.pruning import FOLD_AUC_ATTR
+from mineral_prospect.modeling.resources import limit_n_jobs
+
+GROWN_FROM_ATTR = "grown_from"
+
+
+def ensemble_sizes(n_estimators, fractions=(0.25, 0.5, 0.75)):
+    """Sorted unique prefix sizes ``round(fraction * n_estimators)``, ending at ``n_estimators``"""
+
+    sizes = {max(1, round(fraction * n_estimators)) for fraction in fractions}
+
+    return sorted(size for size in sizes | {n_estimators} if size <= n_estimators)
+
+
+def staged_predict_proba(model, X, sizes):
+    """Positive class probabilities of the first ``k`` trees / rounds of ``model``, for each size
+
+    Returns an ``(n_sizes, n_samples)`` array.
+    """
+
+    if hasattr(model, "get_booster"):
+        return np.array(
+            [model.predict_proba(X, iteration_range=(0, size))[:, 1] for size in sizes]
+        )
+
+    if hasattr(model, "estimators_"):
+        # Same float32 input and tree order as ForestClassifier.predict_proba
+        X = np.asarray(X, dtype=np.float32)
+        cumulative = np.zeros(len(X))
+        probas, start = [], 0
+
+        for size in sizes:
+            for tree in model.estimators_[start:size]:
+                cumulative += tree.predict_proba(X)[:, 1]
+            probas.append(cumulative / size)
+            start = size
+
+        return np.array(probas)
+
+    raise TypeError(f"{type(model).__name__} is neither a fitted forest nor an XGBoost model")
+
+
+def fit_roc_auc_curve(estimator, fold, sizes, predictions=None):
+    """Fits ``estimator`` with ``max(sizes)`` estimators and returns the ROC-AUC of each prefix.
+
+    The validation probabilities of the largest size are appended to the list ``predictions``.
+    """
+
+    X_train, y_train, X_valid, y_valid = fold
+
+    with stage("fit"):
+        model = clone(estimator).set_params(classifier__n_estimators=max(sizes))
+        limit_n_jobs(model).fit(X_train, y_train)
+
+    with stage("predict"):
+        # Samplers only apply when fitting, the other steps transform the validation set
+        for _, step in model.steps[:-1]:
+            if not hasattr(step, "fit_resample"):
+                X_valid = step.transform(X_valid)
+
+        probas = staged_predict_proba(model.named_steps["classifier"], X_valid, sizes)
+
+    if predictions is not None:
+        predictions.append(probas[-1])
+
+    with stage("score"):
+        return np.array([roc_auc_score(y_valid, proba) for proba in probas])
+
+
+def cross_val_roc_auc_curve(estimator, folds, sizes, trial=None, pruner=None, predictions=None):
+    """``(n_folds, n_sizes)`` ROC-AUC of each prefix size over cached ``folds``
+
+    The pruner, if any, is given the scores of the largest size after each fold. The validation
+    probabilities of the largest size are appended to ``predictions`` if given.
+    """
+
+    curves = []
+
+    for fold in folds:
+
+        curves.append(fit_roc_auc_curve(estimator, fold, sizes, predictions))
+
+        if pruner is not None:
+            with stage("prune"):
+                pruner.report(trial, [curve[-1] for curve in curves])
+
+    return np.array(curves)
+
+
+def add_size_trials(trial, estimator, sizes, curves, score, memo=None):
+    """Adds a finished trial to the study for every size but the largest one.
+
+    ``score`` maps the fold scores of a size to the objective values (sizes for which it raises
+    ``TrialPruned`` are skipped). With a ``memo.ObjectiveMemo`` the new trials get the memo key
+    of their configuration, so later proposals of those sizes are not refitted.
+    """
+
+    with stage("add_trials"):
+        _add_size_trials(trial, estimator, sizes, curves, score, memo)
+
+
+def _add_size_trials(trial, estimator, sizes, curves, score, memo):
+
+    distributions = trial.distributions
+
+    for size, scores in zip(sizes[:-1], curves.T[:-1]):
+
+        try:
+            values = score(scores)
+        except optuna.TrialPruned:
+            continue
+
+        # The running means keep the fold pruners' history complete
+        running_means = np.cumsum(scores) / np.arange(1, len(scores) + 1)
+        user_attrs = {GROWN_FROM_ATTR: trial.number, FOLD_AUC_ATTR: running_means.tolist()}
+
+        if memo is not None:
+            sized = clone(estimator).set_params(classifier__n_estimators=size)
+            user_attrs[MEMO_KEY_ATTR] = memo.key(sized)
+
+        trial.study.add_trial(
+            optuna.trial.create_trial(
+                params={**trial.params, "n_estimators": size},
+                distributions=distributions,
+                values=list(values),
+                user_attrs=user_attrs,
+            )
+        )
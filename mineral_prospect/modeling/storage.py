@@ -0,0 +1,110 @@
+"""Study storages and migration between them
+
+SQLite serializes every trial update behind a single database write lock, so with many worker
+processes the bookkeeping stalls ("database is locked"). The journal backend appends each
+operation to a log file instead. The optimization scripts still default to SQLite, where the
+existing studies are; ``storage_url`` refuses a journal that would start next to a database of
+the same study, so migrate the database first::
+
+    python -m mineral_prospect.modeling.storage sqlite:///random_forest.db journal:///random_forest.log
+"""
+
+import argparse
+from pathlib import Path
+
+import optuna
+from optuna.storages import JournalStorage
+from optuna.storages.journal import JournalFileBackend
+
+JOURNAL_SCHEME = "journal:///"
+
+BACKENDS = {
+    "sqlite": "sqlite:///{name}.db",
+    "journal": JOURNAL_SCHEME + "{name}.log",
+}
+
+
+def storage_url(name, backend="sqlite"):
+    """URL of the storage file for the study ``name`` (relative to the working directory).
+
+    Raises ``FileNotFoundError`` for a journal that does not exist yet while ``<name>.db`` does,
+    rather than starting a new study without its history.
+    """
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}, expected one of {list(BACKENDS)}")
+
+    url = BACKENDS[backend].format(name=name)
+    database = BACKENDS["sqlite"].format(name=name)
+
+    if backend == "journal" and not _path(url).exists() and _path(database).exists():
+        raise FileNotFoundError(
+            f"{_path(database)} has the history of {name!r} but {_path(url)} does not exist. "
+            f"Copy it first: python -m mineral_prospect.modeling.storage {database} {url}"
+        )
+
+    return url
+
+
+def _path(url):
+
+    return Path(url.split(":///", 1)[1])
+
+
+def get_storage(url):
+    """Storage object for ``url``; ``journal:///<path>`` selects the append-only journal file.
+
+    Any other value is returned unchanged and handled by optuna (e.g. ``sqlite:///`` URLs).
+    """
+
+    if isinstance(url, str) and url.startswith(JOURNAL_SCHEME):
+        return JournalStorage(JournalFileBackend(url.removeprefix(JOURNAL_SCHEME)))
+
+    return url
+
+
+def migrate(source, target, study_names=None):
+    """Copies the studies in ``source`` (all of them by default) into ``target``.
+
+    Studies that already exist in ``target`` are skipped. Returns the names of the copied studies.
+    """
+
+    from_storage = get_storage(source)
+    to_storage = get_storage(target)
+
+    existing = {summary.study_name for summary in optuna.get_all_study_summaries(to_storage)}
+
+    if study_names is None:
+        study_names = optuna.get_all_study_names(from_storage)
+
+    copied = []
+
+    for study_name in study_names:
+
+        if study_name in existing:
+            print(f"Skipping {study_name}: already in {target}")
+            continue
+
+        optuna.copy_study(
+            from_study_name=study_name, from_storage=from_storage, to_storage=to_storage
+        )
+        copied.append(study_name)
+        print(f"Copied {study_name} from {source} to {target}")
+
+    return copied
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Copy optuna studies between storages")
+    parser.add_argument("source", help="e.g. sqlite:///random_forest.db")
+    parser.add_argument("target", help="e.g. journal:///random_forest.log")
+    parser.add_argument("--study", action="append", dest="studies", help="study to copy")
+
+    args = parser.parse_args()
+
+    migrate(args.source, args.target, args.studies)
+
+
+if __name__ == "__main__":
+    main()
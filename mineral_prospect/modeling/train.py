@@ -0,0 +1,48 @@
+"""Final fit of the configuration selected in an optimization study"""
+
+import joblib
+from imblearn.pipeline import Pipeline as ImbPipeline
+from optuna.trial import FixedTrial
+
+from mineral_prospect.config import MODELS_DIR
+
+
+def select_trial(study):
+    """Pareto-optimal trial with the highest mean ROC-AUC (the first objective)"""
+
+    return max(study.best_trials, key=lambda trial: trial.values[0])
+
+
+def build_pipeline(trial, search_space, classifier, preprocessor, samplers=()):
+    """Pipeline of ``preprocessor``, ``samplers`` and ``classifier`` with the trial's parameters.
+
+    ``search_space`` is replayed on the trial's parameters, so the constants it sets (e.g.
+    ``class_weight``) are included. ``samplers`` are ``(name, sampler)`` steps, only used in fit.
+    """
+
+    params = search_space(FixedTrial(trial.params))
+
+    steps = [("preprocessor", preprocessor), *samplers, ("classifier", classifier(**params))]
+
+    return ImbPipeline(steps)
+
+
+def fit_from_study(study, search_space, classifier, preprocessor, X, y, samplers=(), trial=None):
+    """Fits the pipeline of ``trial`` (``select_trial(study)`` by default) on ``X``, ``y``"""
+
+    if trial is None:
+        trial = select_trial(study)
+
+    pipe = build_pipeline(trial, search_space, classifier, preprocessor, samplers)
+
+    return pipe.fit(X, y.squeeze() if hasattr(y, "squeeze") else y)
+
+
+def save_model(model, name, models_dir=MODELS_DIR):
+    """Saves a fitted pipeline as ``<models_dir>/<name>.joblib`` and returns the path"""
+
+    models_dir.mkdir(parents=True, exist_ok=True)
+    path = models_dir / f"{name}.joblib"
+    joblib.dump(model, path)
+
+    return path
@@ -0,0 +1,488 @@
+"""Columnar warehouse of the finished trials of every study
+
+``sync`` reads the studies of any number of storages (by default every optuna SQLite database and
+journal log under ``notebooks/``) and appends the trials finished since the previous sync to a
+Parquet dataset, one hive partition per study (``study=<storage directory>/<study name>``). A
+study is identified by the directory of its storage and its name, so the ``.db`` and ``.log``
+copies of a migrated study are one study. Every trial is one row:
+
+- ``number``, ``state``, ``datetime_start``, ``datetime_complete`` and ``duration_s``,
+- ``values_<i>``: the objectives, ``(mean ROC-AUC, log10 std)`` in the Pareto studies,
+- ``params_<name>``: numeric parameters as floats, categorical ones as strings,
+- ``user_attrs_<name>``: the scalar user attributes (e.g. ``grown_from``).
+
+The directions of every study are kept in ``_studies.json``. ``load_trials``, ``pareto_front``
+and ``top_k`` read only the partitions and columns they need::
+
+    python -m mineral_prospect.modeling.warehouse sync
+    python -m mineral_prospect.modeling.warehouse pareto --per-study
+    python -m mineral_prospect.modeling.warehouse top --k 5
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import optuna
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from optuna.distributions import CategoricalDistribution
+from optuna.trial import TrialState
+
+from mineral_prospect.config import PROCESSED_DATA_DIR, PROJ_ROOT
+from mineral_prospect.modeling.storage import JOURNAL_SCHEME, get_storage
+
+WAREHOUSE_DIR = PROCESSED_DATA_DIR / "trials"
+
+MANIFEST = "_studies.json"
+
+FINISHED = (TrialState.COMPLETE, TrialState.PRUNED, TrialState.FAIL)
+
+PARTITIONING = ds.partitioning(pa.schema([("study", pa.string())]), flavor="hive")
+
+
+################################## STORAGES ##################################
+
+
+def _is_study_database(path):
+
+    # Opening any other SQLite file as an optuna storage would add optuna's tables to it
+    try:
+        with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as connection:
+            tables = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'studies'"
+            ).fetchall()
+    except sqlite3.DatabaseError:
+        return False
+
+    return bool(tables)
+
+
+def _is_journal(path):
+
+    with open(path, "rb") as file:
+        line = file.readline()
+
+    try:
+        return "op_code" in json.loads(line)
+    except (ValueError, TypeError):
+        return False
+
+
+def find_storages(root=PROJ_ROOT / "notebooks"):
+    """URLs of the optuna SQLite databases and journal logs under ``root``"""
+
+    urls = [f"sqlite:///{path}" for path in sorted(root.rglob("*.db")) if _is_study_database(path)]
+    urls += [
+        JOURNAL_SCHEME + str(path) for path in sorted(root.rglob("*.log")) if _is_journal(path)
+    ]
+
+    return urls
+
+
+def study_key(url, study_name):
+    """Warehouse name of the study ``study_name`` of the storage ``url``"""
+
+    path = Path(url.split(":///", 1)[-1])
+
+    return f"{path.parent.name}/{study_name}"
+
+
+################################## SYNC ##################################
+
+
+def _partition(warehouse_dir, key):
+
+    return Path(warehouse_dir) / f"study={quote(key, safe='')}"
+
+
+def _read_manifest(warehouse_dir):
+
+    path = Path(warehouse_dir) / MANIFEST
+
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def _write_manifest(warehouse_dir, manifest):
+
+    path = Path(warehouse_dir) / MANIFEST
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp_path, path)
+
+
+def _synced_numbers(partition):
+
+    files = sorted(partition.glob("*.parquet"))
+
+    if not files:
+        return set()
+
+    return set(pq.read_table(files, columns=["number"])["number"].to_pylist())
+
+
+def _row(trial, n_objectives):
+
+    row = {
+        "number": trial.number,
+        "state": trial.state.name,
+        "datetime_start": trial.datetime_start,
+        "datetime_complete": trial.datetime_complete,
+    }
+
+    values = trial.values if trial.values is not None else [np.nan] * n_objectives
+    row.update({f"values_{i}": value for i, value in enumerate(values)})
+
+    for name, value in trial.params.items():
+        if isinstance(trial.distributions[name], CategoricalDistribution):
+            row[f"params_{name}"] = None if value is None else str(value)
+        else:
+            row[f"params_{name}"] = float(value)
+
+    # Nested attributes (fold scores, profiles, budgets) stay in the study
+    for name, value in trial.user_attrs.items():
+        if isinstance(value, str):
+            row[f"user_attrs_{name}"] = value
+        elif isinstance(value, (int, float)):
+            row[f"user_attrs_{name}"] = float(value)
+
+    return row
+
+
+def _trials_table(trials, n_objectives):
+
+    df = pd.DataFrame([_row(trial, n_objectives) for trial in trials])
+
+    objectives = [f"values_{i}" for i in range(n_objectives)]
+    df[objectives] = df[objectives].astype(np.float64)
+    for col in ("datetime_start", "datetime_complete"):
+        df[col] = pd.to_datetime(df[col])
+    df["duration_s"] = (df["datetime_complete"] - df["datetime_start"]).dt.total_seconds()
+
+    # Without the pandas metadata, the files of a partition can have different columns
+    return pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+
+
+def _write_part(partition, table):
+
+    partition.mkdir(parents=True, exist_ok=True)
+
+    path = partition / f"part-{time.time_ns()}.parquet"
+    tmp_path = partition / f".{path.name}.{os.getpid()}.tmp"
+
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def sync(storages=None, warehouse_dir=WAREHOUSE_DIR):
+    """Appends the trials of every study of ``storages`` finished since the last sync.
+
+    ``storages`` are storage URLs (``sqlite:///...``, ``journal:///...``), by default those of
+    ``find_storages``. Returns the number of new trials per study.
+    """
+
+    if storages is None:
+        storages = find_storages()
+
+    warehouse_dir = Path(warehouse_dir)
+    warehouse_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = _read_manifest(warehouse_dir)
+    added = {}
+
+    for url in storages:
+
+        storage = get_storage(url)
+
+        for study_name in optuna.get_all_study_names(storage):
+
+            study = optuna.load_study(study_name=study_name, storage=storage)
+            key = study_key(url, study_name)
+            partition = _partition(warehouse_dir, key)
+
+            synced = _synced_numbers(partition)
+            new = [
+                trial
+                for trial in study.get_trials(deepcopy=False, states=FINISHED)
+                if trial.number not in synced
+            ]
+
+            if new:
+                _write_part(partition, _trials_table(new, len(study.directions)))
+
+            added[key] = len(new)
+            manifest[key] = {
+                "storage": url,
+                "study_name": study_name,
+                "directions": [direction.name for direction in study.directions],
+                "n_trials": len(synced) + len(new),
+            }
+
+    _write_manifest(warehouse_dir, manifest)
+
+    return added
+
+
+def compact(warehouse_dir=WAREHOUSE_DIR):
+    """Rewrites every partition written by several syncs as one file"""
+
+    for partition in sorted(Path(warehouse_dir).glob("study=*")):
+
+        files = sorted(partition.glob("*.parquet"))
+
+        if len(files) < 2:
+            continue
+
+        table = pa.concat_tables(
+            [pq.ParquetFile(file).read() for file in files], promote_options="default"
+        )
+        _write_part(partition, table.sort_by("number"))
+
+        for file in files:
+            file.unlink()
+
+
+################################## QUERIES ##################################
+
+
+def studies(warehouse_dir=WAREHOUSE_DIR):
+    """The studies of the warehouse: storage, name, directions and number of trials"""
+
+    manifest = _read_manifest(warehouse_dir)
+
+    return pd.DataFrame.from_dict(manifest, orient="index").rename_axis("study")
+
+
+def _dataset(warehouse_dir):
+
+    files = sorted(Path(warehouse_dir).glob("study=*/*.parquet"))
+
+    if not files:
+        raise FileNotFoundError(f"No trials in {warehouse_dir}, run sync first")
+
+    # Studies have different parameters, and a study can gain some between syncs
+    schema = pa.unify_schemas([pq.read_schema(file) for file in files] + [PARTITIONING.schema])
+
+    return ds.dataset(
+        [str(file) for file in files],
+        schema=schema,
+        format="parquet",
+        partitioning=PARTITIONING,
+        partition_base_dir=str(warehouse_dir),
+    )
+
+
+def load_trials(studies=None, states=("COMPLETE",), columns=None, warehouse_dir=WAREHOUSE_DIR):
+    """Trials of ``studies`` (all by default) in ``states`` as a DataFrame of ``columns`` (all)"""
+
+    dataset = _dataset(warehouse_dir)
+
+    expression = None
+
+    if states is not None:
+        expression = ds.field("state").isin(list(states))
+
+    if studies is not None:
+        in_studies = ds.field("study").isin(list(studies))
+        expression = in_studies if expression is None else expression & in_studies
+
+    if columns is None:
+        columns = dataset.schema.names
+
+    columns = ["study"] + [col for col in columns if col != "study"]
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def _check_studies(manifest, keys):
+
+    unknown = [key for key in keys if key not in manifest]
+    if unknown:
+        raise ValueError(f"Unknown studies {unknown}, expected some of {list(manifest)}")
+
+
+def _directions(manifest, keys):
+
+    _check_studies(manifest, keys)
+
+    directions = {tuple(manifest[key]["directions"]) for key in keys}
+
+    if len(directions) != 1:
+        raise ValueError(f"The studies {keys} do not share their objectives: {directions}")
+
+    return directions.pop()
+
+
+def _nondominated(values):
+    """Positions of the rows of ``values`` (minimized) that no other row dominates"""
+
+    # No row can dominate the rows before it in lexicographic order
+    order = np.lexsort(values.T[::-1])
+    front = []
+
+    for i in order:
+        if not front or not np.all(values[front] <= values[i], axis=1).any():
+            front.append(i)
+
+    return np.sort(front)
+
+
+def pareto_front(studies=None, per_study=False, columns=None, warehouse_dir=WAREHOUSE_DIR):
+    """Complete trials on the Pareto front of ``studies``, across them or ``per_study``.
+
+    The studies must have the same directions, by default they are all the studies with several
+    objectives. Duplicated points are kept once.
+    """
+
+    manifest = _read_manifest(warehouse_dir)
+
+    if studies is None:
+        studies = [key for key, study in manifest.items() if len(study["directions"]) > 1]
+
+    keys = list(studies)
+
+    directions = _directions(manifest, keys)
+    objectives = [f"values_{i}" for i in range(len(directions))]
+
+    if columns is not None:
+        columns = ["number"] + objectives + list(columns)
+
+    trials = load_trials(keys, columns=columns, warehouse_dir=warehouse_dir)
+    trials = trials[np.isfinite(trials[objectives]).all(axis=1)]
+
+    signs = np.array([-1.0 if direction == "MAXIMIZE" else 1.0 for direction in directions])
+    groups = trials.groupby("study", sort=False) if per_study else [(None, trials)]
+
+    front = pd.concat(
+        [group.iloc[_nondominated(group[objectives].to_numpy() * signs)] for _, group in groups]
+    )
+
+    by, ascending = [objectives[0]], [directions[0] == "MINIMIZE"]
+    if per_study:
+        by, ascending = ["study"] + by, [True] + ascending
+
+    return front.sort_values(by, ascending=ascending, ignore_index=True)
+
+
+def top_k(
+    k=10,
+    by="values_0",
+    studies=None,
+    per_study=True,
+    ascending=None,
+    columns=None,
+    warehouse_dir=WAREHOUSE_DIR,
+):
+    """The ``k`` best complete trials by ``by`` of each study, or of all of them together.
+
+    For an objective, the studies without it are skipped and ``ascending`` defaults to its
+    direction in each study (which must be the same in every study unless ``per_study``).
+    Otherwise ``ascending`` defaults to descending.
+    """
+
+    manifest = _read_manifest(warehouse_dir)
+    keys = list(manifest) if studies is None else list(studies)
+
+    _check_studies(manifest, keys)
+
+    # Whether each study sorts ``by`` in ascending order
+    orders = dict.fromkeys(keys, bool(ascending))
+
+    if by.startswith("values_"):
+        index = int(by.removeprefix("values_"))
+        keys = [key for key in keys if len(manifest[key]["directions"]) > index]
+
+        if not keys:
+            raise ValueError(f"None of the studies has the objective {by}")
+
+        if ascending is None:
+            orders = {key: manifest[key]["directions"][index] == "MINIMIZE" for key in keys}
+
+        if not per_study and len(set(orders.values())) > 1:
+            raise ValueError(f"The studies {keys} do not share the direction of {by}")
+
+    if columns is not None:
+        columns = ["number", by] + [col for col in columns if col != by]
+
+    trials = load_trials(keys, columns=columns, warehouse_dir=warehouse_dir)
+    trials = trials.dropna(subset=[by])
+
+    if not per_study:
+        top = trials.sort_values(by, ascending=orders[keys[0]], kind="stable").head(k)
+    else:
+        top = pd.concat(
+            [
+                group.sort_values(by, ascending=orders[key], kind="stable").head(k)
+                for key, group in trials.groupby("study", sort=False)
+            ]
+        )
+
+    return top.reset_index(drop=True)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Warehouse of the trials of every study")
+    parser.add_argument("--warehouse-dir", type=Path, default=WAREHOUSE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sync_parser = commands.add_parser("sync", help="append the newly finished trials")
+    sync_parser.add_argument("storages", nargs="*", help="storage URLs, default: notebooks/")
+    sync_parser.add_argument("--compact", action="store_true", help="then one file per study")
+
+    commands.add_parser("studies", help="list the studies")
+
+    pareto_parser = commands.add_parser("pareto", help="print the Pareto front")
+    pareto_parser.add_argument("--study", action="append", dest="studies")
+    pareto_parser.add_argument("--per-study", action="store_true")
+    pareto_parser.add_argument("--columns", nargs="+")
+
+    top_parser = commands.add_parser("top", help="print the best trials of each study")
+    top_parser.add_argument("--k", type=int, default=10)
+    top_parser.add_argument("--by", default="values_0")
+    top_parser.add_argument("--study", action="append", dest="studies")
+    top_parser.add_argument("--overall", action="store_true", help="across all the studies")
+    top_parser.add_argument("--columns", nargs="+")
+
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        added = sync(args.storages or None, args.warehouse_dir)
+        for key, n_trials in added.items():
+            print(f"{key}: {n_trials} new trials")
+        if args.compact:
+            compact(args.warehouse_dir)
+        return
+
+    if args.command == "studies":
+        result = studies(args.warehouse_dir)
+    elif args.command == "pareto":
+        result = pareto_front(args.studies, args.per_study, args.columns, args.warehouse_dir)
+    else:
+        result = top_k(
+            args.k,
+            args.by,
+            args.studies,
+            not args.overall,
+            columns=args.columns,
+            warehouse_dir=args.warehouse_dir,
+        )
+
+    with pd.option_context(
+        "display.max_rows", None, "display.max_columns", None, "display.width", 200
+    ):
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
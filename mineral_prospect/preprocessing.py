@@ -0,0 +1,211 @@
+"""Preprocessing transformers shared by training and scoring"""
+
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.metrics.pairwise import nan_euclidean_distances
+from sklearn.neighbors import BallTree, KDTree
+from sklearn.utils.validation import check_is_fitted
+
+INDEXES = {"kd_tree": KDTree, "ball_tree": BallTree}
+
+
+def _weights(dist, weights):
+
+    if weights == "uniform":
+        return None
+
+    with np.errstate(divide="ignore"):
+        inverse = 1.0 / dist
+
+    # Donors at zero distance take all the weight, as in sklearn's neighbors estimators
+    inf_mask = np.isinf(inverse)
+    inf_rows = inf_mask.any(axis=1)
+    inverse[inf_rows] = inf_mask[inf_rows]
+    inverse[np.isnan(inverse)] = 0.0
+
+    return inverse
+
+
+def _average(values, dist, weights):
+
+    weight_matrix = _weights(dist, weights)
+    values = np.ma.array(values, mask=np.isnan(values))
+
+    return np.ma.average(values, axis=1, weights=weight_matrix).data
+
+
+class NeighborsImputer(TransformerMixin, BaseEstimator):
+    """Drop-in replacement for ``KNNImputer`` (``nan_euclidean`` metric, ``missing_values=nan``).
+
+    ``algorithm="brute"`` (the default) computes the distances to every training row, in chunks
+    of ``chunk_size`` rows, and reproduces ``KNNImputer``.
+
+    ``"kd_tree"`` and ``"ball_tree"`` are an opt-in for large training sets. They build, for each
+    missing pattern and imputed column, a tree over the training rows observed on the pattern's
+    columns and only compute the distances to the remaining training rows directly; the trees
+    are kept and reused by later ``transform`` calls. They change the imputed values: tied or
+    nearly tied neighbours (rounding differs from ``nan_euclidean_distances``) are picked
+    differently, and a row with fewer than ``n_neighbors`` donors at a defined distance does not
+    average donors at undefined distance as ``KNNImputer`` does. On the unscaled ``X_train``
+    about 2% of the imputed values differ, by up to 5.9e8.
+    """
+
+    def __init__(
+        self,
+        n_neighbors=5,
+        weights="uniform",
+        algorithm="brute",
+        leaf_size=30,
+        chunk_size=1024,
+    ):
+
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.algorithm = algorithm
+        self.leaf_size = leaf_size
+        self.chunk_size = chunk_size
+
+    def fit(self, X, y=None):
+
+        X = self._validate_data(X, dtype=np.float64, force_all_finite="allow-nan")
+
+        self.fit_X_ = X
+        self.mask_fit_X_ = np.isnan(X)
+        self.valid_mask_ = ~self.mask_fit_X_.all(axis=0)
+        self.column_means_ = np.ma.array(X, mask=self.mask_fit_X_).mean(axis=0).data
+
+        self.algorithm_ = self.algorithm
+
+        if self.algorithm_ not in ("brute", *INDEXES):
+            raise ValueError(f"Unknown algorithm {self.algorithm!r}")
+
+        self._indexes = {}
+
+        return self
+
+    def transform(self, X):
+
+        check_is_fitted(self)
+
+        X = self._validate_data(
+            X, dtype=np.float64, force_all_finite="allow-nan", copy=True, reset=False
+        )
+
+        mask = np.isnan(X)
+        row_missing_idx = np.flatnonzero(mask[:, self.valid_mask_].any(axis=1))
+
+        impute = self._impute_brute if self.algorithm_ == "brute" else self._impute_indexed
+
+        # Bounded memory: at most ``chunk_size`` receivers against the training rows at a time
+        for start in range(0, len(row_missing_idx), self.chunk_size):
+            stop = start + self.chunk_size
+            rows = row_missing_idx[start:stop]
+            X[rows] = impute(X[rows], mask[rows])
+
+        return X[:, self.valid_mask_]
+
+    def _impute_brute(self, X, mask):
+
+        dist = nan_euclidean_distances(X, self.fit_X_)
+
+        for col in np.flatnonzero(self.valid_mask_ & mask.any(axis=0)):
+
+            receivers = np.flatnonzero(mask[:, col])
+            donors = np.flatnonzero(~self.mask_fit_X_[:, col])
+            dist_subset = dist[np.ix_(receivers, donors)]
+
+            all_nan = np.isnan(dist_subset).all(axis=1)
+            X[receivers[all_nan], col] = self.column_means_[col]
+
+            if all_nan.all():
+                continue
+
+            receivers, dist_subset = receivers[~all_nan], dist_subset[~all_nan]
+
+            n_neighbors = min(self.n_neighbors, len(donors))
+            donors_idx = np.argpartition(dist_subset, n_neighbors - 1, axis=1)[:, :n_neighbors]
+            donors_dist = np.take_along_axis(dist_subset, donors_idx, axis=1)
+
+            values = self.fit_X_[donors[donors_idx], col]
+            X[receivers, col] = _average(values, donors_dist, self.weights)
+
+        return X
+
+    def _impute_indexed(self, X, mask):
+
+        patterns, inverse = np.unique(mask, axis=0, return_inverse=True)
+
+        for pattern_idx, pattern in enumerate(patterns):
+
+            rows = np.flatnonzero(inverse.ravel() == pattern_idx)
+            observed = np.flatnonzero(~pattern)
+
+            # Distances use the rows as given, not the columns already imputed
+            X_rows = X[rows]
+
+            for col in np.flatnonzero(self.valid_mask_ & pattern):
+                X[rows, col] = self._impute_column(X_rows, pattern, observed, col)
+
+        return X
+
+    def _impute_column(self, X, pattern, observed, col):
+
+        if len(observed) == 0:
+            return np.full(len(X), self.column_means_[col])
+
+        index, complete, partial = self._index(pattern, observed, col)
+
+        # nan_euclidean over the observed columns, rescaled to the number of features
+        scale = np.sqrt(X.shape[1] / len(observed))
+
+        candidates_dist, candidates = [], []
+
+        if index is not None:
+            k = min(self.n_neighbors, len(complete))
+            dist, idx = index.query(X[:, observed], k=k)
+            candidates_dist.append(dist * scale)
+            candidates.append(complete[idx])
+
+        if len(partial):
+            candidates_dist.append(nan_euclidean_distances(X, self.fit_X_[partial]))
+            candidates.append(np.broadcast_to(partial, (len(X), len(partial))))
+
+        dist = np.concatenate(candidates_dist, axis=1)
+        candidates = np.concatenate(candidates, axis=1)
+
+        # Undefined distances go last and are never used as donors
+        dist = np.where(np.isnan(dist), np.inf, dist)
+        n_neighbors = min(self.n_neighbors, dist.shape[1])
+        order = np.argpartition(dist, n_neighbors - 1, axis=1)[:, :n_neighbors]
+
+        donors_dist = np.take_along_axis(dist, order, axis=1)
+        values = self.fit_X_[np.take_along_axis(candidates, order, axis=1), col]
+        values[np.isinf(donors_dist)] = np.nan
+
+        imputed = np.full(len(X), self.column_means_[col])
+        defined = ~np.isinf(donors_dist).all(axis=1)
+        imputed[defined] = _average(values[defined], donors_dist[defined], self.weights)
+
+        return imputed
+
+    def _index(self, pattern, observed, col):
+
+        key = (pattern.tobytes(), col)
+
+        if key not in self._indexes:
+
+            has_col = ~self.mask_fit_X_[:, col]
+            is_complete = ~self.mask_fit_X_[:, observed].any(axis=1)
+
+            complete = np.flatnonzero(has_col & is_complete)
+            partial = np.flatnonzero(has_col & ~is_complete)
+
+            index = None
+            if len(complete):
+                index = INDEXES[self.algorithm_](
+                    self.fit_X_[np.ix_(complete, observed)], leaf_size=self.leaf_size
+                )
+
+            self._indexes[key] = (index, complete, partial)
+
+        return self._indexes[key]
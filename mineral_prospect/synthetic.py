@@ -0,0 +1,300 @@
+"""Synthetic copper mines, schema-identical to the training set, for scale tests
+
+``SyntheticMines.fit(X, y)`` learns from ``X_train`` and the continuous ``y_train`` TIR, separately
+for the unpromising (TIR below ``MIN_TIR``) and the other mines:
+
+- the marginal distribution of every base feature (``features.BASE_FEATURES``) and of TIR: their
+  empirical quantiles, interpolated in log scale for non-negative columns, and the share of zeros
+  of TIR,
+- the rank correlations between them, reproduced with a Gaussian copula,
+- which base features are missing and which are zero, drawn as whole patterns: grades that are
+  never all zero together in ``X_train`` (a division by zero in ``INITIAL_COST_PER_AMOUNT``)
+  never are in the synthetic mines either,
+- the frequencies of the categories of every text column, missing values included.
+
+The derived and ``LOG_10_`` columns are computed from the sampled base features with
+``features.numeric_features``, so they keep their exact relationships and missing values spread
+to them as in the real data. ``write`` streams any number of rows to ``X_train.parquet``,
+``y_train.parquet`` and ``y_train_cat.parquet``, one row group per chunk, so 10^7 rows never have to
+fit in memory::
+
+    python -m mineral_prospect.synthetic --rows 10000000 --output-dir data/interim/copper/synthetic
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from scipy.special import ndtr, ndtri
+
+from mineral_prospect.config import COPPER_INTERIM_DIR, MIN_TIR
+from mineral_prospect.features import BASE_FEATURES, NUMERIC_FEATURES, numeric_features
+
+SYNTHETIC_DIR = COPPER_INTERIM_DIR / "synthetic"
+
+CHUNK_SIZE = 100_000
+
+
+def _marginal(values):
+    """Quantiles of the non-missing ``values``; non-negative ones in log10 with the zeros apart"""
+
+    values = values[~np.isnan(values)]
+    log = len(values) > 0 and values.min() >= 0 and values.max() > 0
+
+    if log:
+        zero = np.mean(values == 0)
+        quantiles = np.log10(np.sort(values[values > 0]))
+    else:
+        zero = 0.0
+        quantiles = np.sort(values)
+
+    return {"log": log, "zero": zero, "quantiles": quantiles}
+
+
+def _inverse_cdf(marginal, u):
+
+    quantiles = marginal["quantiles"]
+
+    if len(quantiles) == 0:
+        return np.zeros_like(u)
+
+    # Zeros are the lowest values of a log-scale column, so they take the bottom of [0, 1]
+    zero = marginal["zero"]
+    scaled = np.clip((u - zero) / (1 - zero), 0, 1) if zero < 1 else np.zeros_like(u)
+
+    values = np.interp(scaled, np.linspace(0, 1, len(quantiles)), quantiles)
+
+    if marginal["log"]:
+        values = 10**values
+        values[u < zero] = 0
+
+    return values
+
+
+def _copula(values):
+    """Cholesky factor of the correlation of the normal scores of the columns of ``values``"""
+
+    ranks = pd.DataFrame(values).rank()
+    scores = ndtri((ranks - 0.5) / ranks.count())
+
+    # Pairwise over the non-missing rows; constant columns are left uncorrelated
+    correlation = scores.corr().fillna(0).to_numpy()
+    np.fill_diagonal(correlation, 1)
+
+    # The pairwise estimate is not always positive definite
+    eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+    correlation = (eigenvectors * np.clip(eigenvalues, 1e-6, None)) @ eigenvectors.T
+    scale = np.sqrt(np.diag(correlation))
+
+    return np.linalg.cholesky(correlation / np.outer(scale, scale))
+
+
+class SyntheticMines:
+    """Generator of mines like those of a training set, see the module docstring"""
+
+    def fit(self, X, y):
+        """Learns the distributions of ``X`` (``X_train``) and the TIR ``y`` (``y_train``)"""
+
+        if isinstance(y, pd.DataFrame):
+            y = y.iloc[:, 0]
+
+        numeric = list(X.select_dtypes("number").columns)
+        if sorted(numeric) != sorted(NUMERIC_FEATURES):
+            raise ValueError("The numeric columns of X are not features.NUMERIC_FEATURES")
+
+        self.X_schema = pa.Schema.from_pandas(X, preserve_index=False)
+        self.target = y.name
+        self.categorical = [col for col in X.columns if col not in numeric]
+
+        # Known categories of every text column, in order of frequency
+        self.categories = {
+            col: X[col].value_counts().index.astype(str).tolist() for col in self.categorical
+        }
+
+        tir = y.to_numpy(dtype=np.float64)
+        label = tir < MIN_TIR
+
+        # Derived columns that must stay finite, see _sample_tables
+        self.finite = [col for col in numeric if not np.isinf(X[col]).any()]
+
+        self.positive_rate = label.mean()
+        self.classes = {
+            value: self._fit_class(X[label == value], tir[label == value])
+            for value in (False, True)
+        }
+
+        return self
+
+    def _fit_class(self, X, tir):
+
+        base = X[BASE_FEATURES].to_numpy(dtype=np.float64)
+
+        # State of every base feature of a mine: a value (0), missing (1) or zero (2)
+        states = np.select([np.isnan(base), base == 0], [1, 2], 0).astype(np.int8)
+        patterns, counts = np.unique(states, axis=0, return_counts=True)
+
+        # Zeros come from the patterns, the marginals and the copula are those of the values
+        values = np.column_stack([np.where(base == 0, np.nan, base), tir])
+
+        frequencies = {}
+        for col, categories in self.categories.items():
+            # The last frequency is that of missing values
+            known = X[col].value_counts().reindex(categories, fill_value=0).to_numpy()
+            frequencies[col] = np.append(known, X[col].isna().sum()) / len(X)
+
+        return {
+            "marginals": [_marginal(column) for column in values.T],
+            "copula": _copula(values),
+            "patterns": patterns,
+            "pattern_frequencies": counts / counts.sum(),
+            "frequencies": frequencies,
+        }
+
+    def sample(self, n_rows, seed=0):
+        """``(X, y)`` DataFrames of ``n_rows`` synthetic mines, like ``X_train`` and ``y_train``"""
+
+        X, y = self._sample_tables(n_rows, np.random.default_rng(seed))
+
+        return X.to_pandas(), y.to_pandas()
+
+    def _sample_tables(self, n_rows, rng):
+
+        label = rng.random(n_rows) < self.positive_rate
+
+        base = np.empty((n_rows, len(BASE_FEATURES)))
+        tir = np.empty(n_rows)
+        codes = {col: np.empty(n_rows, dtype=np.int32) for col in self.categorical}
+
+        for value, model in self.classes.items():
+
+            rows = np.flatnonzero(label == value)
+            if len(rows) == 0:
+                continue
+
+            # Correlated uniforms, mapped through the quantiles of every column
+            z = rng.standard_normal((len(rows), len(model["marginals"]))) @ model["copula"].T
+            u = ndtr(z)
+            columns = [
+                _inverse_cdf(marginal, u[:, i]) for i, marginal in enumerate(model["marginals"])
+            ]
+
+            pattern = rng.choice(
+                len(model["patterns"]), size=len(rows), p=model["pattern_frequencies"]
+            )
+
+            states = model["patterns"][pattern]
+            base[rows] = np.select(
+                [states == 1, states == 2], [np.nan, 0.0], np.column_stack(columns[:-1])
+            )
+            tir[rows] = columns[-1]
+
+            for col, frequencies in model["frequencies"].items():
+                codes[col][rows] = rng.choice(len(frequencies), size=len(rows), p=frequencies)
+
+        numeric = numeric_features(base)
+
+        infinite = [
+            name
+            for i, name in enumerate(NUMERIC_FEATURES)
+            if name in self.finite and np.isinf(numeric[:, i]).any()
+        ]
+        if infinite:
+            raise ValueError(f"Synthetic {infinite} have infinite values, X_train has none")
+
+        arrays = {name: numeric[:, i] for i, name in enumerate(NUMERIC_FEATURES)}
+        for col, categories in self.categories.items():
+            missing = codes[col] == len(categories)
+            indices = pa.array(np.where(missing, 0, codes[col]), mask=missing)
+            arrays[col] = pa.DictionaryArray.from_arrays(
+                indices, pa.array(categories, pa.string())
+            ).dictionary_decode()
+
+        X = pa.Table.from_arrays(
+            [arrays[col] for col in self.X_schema.names], schema=self.X_schema
+        )
+        y = pa.table({self.target: tir})
+
+        return X, y
+
+    def write(self, output_dir=SYNTHETIC_DIR, n_rows=10**6, chunk_size=CHUNK_SIZE, seed=0):
+        """Streams ``n_rows`` mines to ``X_train``, ``y_train`` and ``y_train_cat`` Parquet files.
+
+        Every chunk has its own random stream, so a seed and chunk size always give the same
+        rows. Returns the paths of the three files.
+        """
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        names = ("X_train", "y_train", "y_train_cat")
+        paths = [output_dir / f"{name}.parquet" for name in names]
+        tmp_paths = [path.with_suffix(f".{os.getpid()}.tmp") for path in paths]
+
+        n_chunks = -(-n_rows // chunk_size)
+        streams = np.random.SeedSequence(seed).spawn(n_chunks)
+
+        writers = None
+
+        try:
+            for i, stream in enumerate(streams):
+
+                size = min(chunk_size, n_rows - i * chunk_size)
+                X, y = self._sample_tables(size, np.random.default_rng(stream))
+                y_cat = pa.table({self.target: pc.less(y[self.target], MIN_TIR)})
+
+                tables = (X, y, y_cat)
+
+                if writers is None:
+                    writers = [
+                        pq.ParquetWriter(tmp_path, table.schema)
+                        for tmp_path, table in zip(tmp_paths, tables)
+                    ]
+
+                for writer, table in zip(writers, tables):
+                    writer.write_table(table, row_group_size=size)
+
+        finally:
+            for writer in writers or []:
+                writer.close()
+
+        # Renamed once complete, so readers never see a partial dataset
+        for tmp_path, path in zip(tmp_paths, paths):
+            os.replace(tmp_path, path)
+
+        return paths
+
+
+def load_synthetic(X_path=None, y_path=None):
+    """``SyntheticMines`` fitted on ``X_train`` and ``y_train`` (the copper files by default)"""
+
+    X = pd.read_parquet(X_path or COPPER_INTERIM_DIR / "X_train.parquet")
+    y = pd.read_parquet(y_path or COPPER_INTERIM_DIR / "y_train.parquet")
+
+    return SyntheticMines().fit(X, y)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Writes a synthetic copper training set")
+    parser.add_argument("--rows", type=int, default=10**6)
+    parser.add_argument("--output-dir", type=Path, default=SYNTHETIC_DIR)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--X", type=Path, default=COPPER_INTERIM_DIR / "X_train.parquet")
+    parser.add_argument("--y", type=Path, default=COPPER_INTERIM_DIR / "y_train.parquet")
+
+    args = parser.parse_args()
+
+    generator = load_synthetic(args.X, args.y)
+    paths = generator.write(args.output_dir, args.rows, args.chunk_size, args.seed)
+
+    print(f"Wrote {args.rows} rows to {paths[0].parent}")
+
+
+if __name__ == "__main__":
+    main()
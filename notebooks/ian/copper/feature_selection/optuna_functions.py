@@ -1,7 +1,4 @@
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import roc_auc_score
 import numpy as np
-import pandas as pd
 import optuna
 
 
@@ -68,19 +65,3 @@ def optm_score(scores):
     #return mean + variation
 
     return mean, np.log10(std)
-
-def early_prune(pipe, X_train, y_train):
-
-    X_att, X_valid, y_att, y_valid = train_test_split(X_train, y_train, test_size=30, random_state=42) 
-
-    X_att = pd.DataFrame(X_att, columns=X_train.columns)
-    X_valid = pd.DataFrame(X_valid, columns=X_train.columns)
-
-    pipe.fit(X_att, y_att)
-
-    roc_auc = roc_auc_score(y_valid, pipe.predict_proba(X_valid)[:, 1])
-
-    if roc_auc < 0.5:
-        raise optuna.TrialPruned()
-    
-    return roc_auc
\ No newline at end of file
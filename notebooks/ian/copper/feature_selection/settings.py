@@ -1,40 +1,89 @@
+import numpy as np
 from imblearn.over_sampling import SMOTE
 from imblearn.under_sampling import RandomUnderSampler
 from sklearn.pipeline import Pipeline
 from category_encoders import BinaryEncoder
 from sklearn.model_selection import RepeatedStratifiedKFold
-from sklearn.impute import KNNImputer
 from sklearn.preprocessing import StandardScaler
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import FunctionTransformer
 
+from mineral_prospect.modeling.convergence import HypervolumeStop
+from mineral_prospect.modeling.fidelity import Budget, MultiFidelity
+from mineral_prospect.modeling.pruning import MedianFoldPruner
+from mineral_prospect.preprocessing import NeighborsImputer
+
 from constants import NUM_FEATURES, CAT_FEATURES
 
 ######################### TRANSFORMATIONS #########################
 OVER = SMOTE(sampling_strategy="auto")
 UNDER = RandomUnderSampler(sampling_strategy="auto")
 
+# Seed of OVER and UNDER inside CachedResampler: every trial sees the same resampled folds
+RESAMPLING_SEED = 42
+
 CAT_PIPE = Pipeline(steps=[
     ('binary_encoder', BinaryEncoder())
 ])
 
 num_steps = [
         ('scaler', StandardScaler()),
-        ('imputer', KNNImputer(n_neighbors=5)),
+        ('imputer', NeighborsImputer(n_neighbors=5)),
 ]
 
 NUM_PIPE = Pipeline(steps=num_steps)
 
 
 ####################### PREPROCESSORS #######################
+# Only module-level callables here, so the preprocessors can be pickled into worker processes
 FEAT_SEL_PRE = ColumnTransformer(
     transformers=[
         ('num', NUM_PIPE, NUM_FEATURES),
         ('cat', CAT_PIPE, CAT_FEATURES), 
-        ('array', FunctionTransformer(lambda X: X.values, validate=False), [])
+        ('array', FunctionTransformer(np.asarray, validate=False), [])
     ]
 )
 
 ###################### CROSS VALIDATION ##########################
 
-RKF = RepeatedStratifiedKFold(n_splits=2, n_repeats=5, random_state=42)
\ No newline at end of file
+RKF = RepeatedStratifiedKFold(n_splits=2, n_repeats=5, random_state=42)
+
+# Stops trials whose running mean ROC-AUC after 2+ folds is below the median of complete trials
+# (swap for SuccessiveHalvingFoldPruner or NopFoldPruner)
+PRUNER = MedianFoldPruner(n_startup_trials=20, min_folds=2)
+
+# Random forest / XGBoost trials are also scored at these fractions of their n_estimators,
+# using prefixes of the same fit, and the results are added to the study as extra trials
+ENSEMBLE_SIZE_FRACTIONS = (0.25, 0.5, 0.75)
+
+# Random forest trials are scored on a cheap budget first (60% of X_train with 3 folds) and,
+# after the first 10, only the best quarter moves up to X_train with RKF, where PRUNER judges
+# the first 2 folds. Over 600 trials 80% of the fits are on the cheap budget (58% over 60).
+# The 60% subset is the smallest whose training folds keep the 6 positives SMOTE needs.
+# MultiFidelity([Budget(1.0, RKF)]) scores every trial on the full budget
+FIDELITY = MultiFidelity(
+    [
+        Budget(0.6, RepeatedStratifiedKFold(n_splits=3, n_repeats=1, random_state=42)),
+        Budget(1.0, RKF),
+    ],
+    reduction_factor=4,
+    n_startup_trials=10,
+)
+
+# Studies stop before n_trials once the hypervolume of their Pareto front (mean ROC-AUC, log10 std)
+# grew by less than 0.1% over the last 500 trials, and never before 1000 trials.
+# The reason a study stopped is its "stop_reason" user attribute
+STOPPER = HypervolumeStop(patience=500, min_improvement=1e-3, n_min_trials=1000)
+
+# Preprocessed folds shared by every trial (and process) of the studies
+CACHE_DIR = "fold_cache"
+
+# Out-of-fold probabilities of every complete trial (float16, per study and trial), for
+# ensemble selection without refitting: python -m mineral_prospect.modeling.oof oof
+# None stores nothing
+OOF_DIR = "oof"
+
+# "sqlite" (the existing <study>.db files) or "journal" (append-only log file, for many concurrent
+# workers). Copy the .db studies before switching, or the scripts refuse to start:
+# python -m mineral_prospect.modeling.storage sqlite:///xgboost.db journal:///xgboost.log
+STORAGE_BACKEND = "sqlite"
@@ -1,15 +1,2 @@
-def importance_estimation(X, y, pipe):
-   
-    pipe.fit(X, y)
-
-    model = pipe.named_steps["classifier"]
-    
-    feature_importances = model.feature_importances_
-    
-    return feature_importances
-
-def importance_experiment(X_list, y_list, pipe):
-    
-    importances_list = [importance_estimation(X, y, pipe) for X, y in zip(X_list, y_list)]
-
-    return importances_list
\ No newline at end of file
+# Parallel over the shards, see importance_experiment for backend, n_workers and chunk_size
+from mineral_prospect.modeling.importance import importance_estimation, importance_experiment
@@ -6,6 +6,10 @@ from sklearn.model_selection import cross_val_score
 from optuna.samplers import TPESampler
 from optuna_functions import search_space, early_prune, optm_score
 
+from mineral_prospect.modeling.profiling import profiled, stage
+from mineral_prospect.modeling.resources import allocate, limited_threads
+from mineral_prospect.modeling.sampling import WindowedSampler, recorded
+
 from settings import MODEL_PRE, OVER, UNDER, RKF
 
 def objective(trial):
@@ -18,9 +22,11 @@ def objective(trial):
     
     pipe = ImbPipeline(steps_list)
 
-    early_prune(pipe, X_train, y_train)
+    with stage('early_prune'):
+        early_prune(pipe, X_train, y_train)
     
-    scores = cross_val_score(pipe, X_train, y_train, cv=RKF, scoring="roc_auc")
+    with stage('cross_val_score'):
+        scores = cross_val_score(pipe, X_train, y_train, cv=RKF, scoring="roc_auc")
 
     score = optm_score(scores)
 
@@ -31,14 +37,25 @@ if __name__ == "__main__":
     X_train = pd.read_parquet("../../../../../data/interim/copper/X_train.parquet")
     y_train = pd.read_parquet("../../../../../data/interim/copper/y_train_cat.parquet")
 
+    # One trial thread per core of the budget, each with a single BLAS/OpenMP thread
+    n_workers, n_threads = allocate()
+
+    # The idle trial threads get their suggestions from one history snapshot per batch
+    sampler = WindowedSampler(TPESampler(multivariate=True,
+                                         n_startup_trials = 100, group=True,
+                                         warn_independent_sampling=False,
+                                         n_ei_candidates=50,
+                                         constant_liar=True),
+                              batch_size=n_workers)
+
     study = optuna.create_study(directions=['maximize'], 
                                 storage='sqlite:///decision_tree_model.db',
                                 study_name="decision_tree_model",
                                 load_if_exists=True,
-                                sampler=TPESampler(multivariate=True,
-                                                n_startup_trials = 100, group=True,
-                                                warn_independent_sampling=False,
-                                                n_ei_candidates=50,
-                                                constant_liar=True))
+                                sampler=sampler)
 
-    study.optimize(objective, n_trials=1000, n_jobs=-1)
\ No newline at end of file
+    # Trials run as threads here, so memory is not traced (tracemalloc is process-wide) and
+    # the CPU times of concurrent trials overlap
+    with limited_threads(n_threads):
+        study.optimize(recorded(profiled(objective, memory=False)), n_trials=1000,
+                       n_jobs=n_workers)
\ No newline at end of file
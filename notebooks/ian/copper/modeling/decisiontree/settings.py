@@ -1,14 +1,16 @@
+import numpy as np
 from imblearn.over_sampling import SMOTE
 from imblearn.under_sampling import RandomUnderSampler
 from sklearn.pipeline import Pipeline
 from category_encoders import BinaryEncoder
 from sklearn.model_selection import RepeatedStratifiedKFold
-from sklearn.impute import KNNImputer
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import FunctionTransformer
 
+from mineral_prospect.preprocessing import NeighborsImputer
+
 from constants import NUM_FEATURES, CAT_FEATURES, NUM_SELECTED, CAT_SELECTED, N_COMP
 
 ######################### TRANSFORMATIONS #########################
@@ -21,7 +23,7 @@ CAT_PIPE = Pipeline(steps=[
 
 NUM_BASIC_STEPS =  [
         ('scaler', StandardScaler()),
-        ('imputer', KNNImputer(n_neighbors=5)),
+        ('imputer', NeighborsImputer(n_neighbors=5)),
 ]
 
 NUM_PIPE = Pipeline(steps=NUM_BASIC_STEPS)
@@ -30,11 +32,12 @@ NUM_PCA_PIPE = Pipeline(steps=NUM_BASIC_STEPS + [( 'pca', PCA(n_components=N_COM
 
 
 ####################### PREPROCESSORS #######################
+# Only module-level callables here, so the preprocessors can be pickled into worker processes
 FEAT_SEL_PRE = ColumnTransformer(
     transformers=[
         ('num', NUM_PIPE, NUM_FEATURES),
         ('cat', CAT_PIPE, CAT_FEATURES), 
-        ('array', FunctionTransformer(lambda X: X.values, validate=False), [])
+        ('array', FunctionTransformer(np.asarray, validate=False), [])
     ]
 )
 
@@ -42,7 +45,7 @@ MODEL_PRE = ColumnTransformer(
     transformers=[
         ('num', NUM_PCA_PIPE, NUM_SELECTED),
         ('cat', CAT_PIPE, CAT_SELECTED),
-        ('array', FunctionTransformer(lambda X: X.values, validate=False), [])
+        ('array', FunctionTransformer(np.asarray, validate=False), [])
     ]
 )
 
@@ -1,16 +1,13 @@
-def importance_estimation_decision_tree(X, y, pipe):
-
-    pipe.fit(X, y)
+from mineral_prospect.modeling.importance import importance_estimation, importance_experiment
 
-    model = pipe.named_steps["classifier"]
 
-    feature_importances = model.feature_importances_
-
-    return feature_importances
+def importance_estimation_decision_tree(X, y, pipe):
 
+    return importance_estimation(X, y, pipe)
 
-def importance_experiment_decision_tree(X_list, y_list, pipe):
 
-    importances_list = [importance_estimation_decision_tree(X, y, pipe) for X, y in zip(X_list, y_list)]
+def importance_experiment_decision_tree(X_list, y_list, pipe, **kwargs):
+    # Parallel over the shards, see importance_experiment for backend, n_workers and chunk_size
+    # One importance array per shard, as before
 
-    return importances_list
+    return list(importance_experiment(X_list, y_list, pipe, **kwargs))
@@ -0,0 +1,58 @@
+import argparse
+
+import optuna
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+from xgboost import XGBClassifier
+from optuna_functions import search_space_decision_tree, search_space_random_forest, search_space_xgboost
+
+from mineral_prospect.modeling.artifact import export_artifact
+from mineral_prospect.modeling.storage import get_storage, storage_url
+from mineral_prospect.modeling.train import fit_from_study, save_model, select_trial
+
+from settings import MODEL_PRE, OVER, UNDER, RESAMPLING_SEED, STORAGE_BACKEND
+
+##########################################################################################
+
+MODELS = {
+    'decision_tree': (search_space_decision_tree, DecisionTreeClassifier),
+    'random_forest': (search_space_random_forest, RandomForestClassifier),
+    'xgboost': (search_space_xgboost, XGBClassifier),
+}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Fits the selected trial of a study on X_train")
+    parser.add_argument('study', choices=list(MODELS))
+    parser.add_argument('--trial', type=int, help="trial number (default: best Pareto mean ROC-AUC)")
+    parser.add_argument('--no-artifact', action='store_true',
+                        help="only save the joblib pipeline, not the models/<study>/v<N> artifact")
+    args = parser.parse_args()
+
+    X_train = pd.read_parquet("../../../../../data/interim/copper/X_train.parquet")
+    y_train = pd.read_parquet("../../../../../data/interim/copper/y_train_cat.parquet")
+
+    study = optuna.load_study(study_name=args.study,
+                              storage=get_storage(storage_url(args.study, STORAGE_BACKEND)))
+
+    trial = study.trials[args.trial] if args.trial is not None else select_trial(study)
+
+    search_space, classifier = MODELS[args.study]
+
+    samplers = [('over', clone(OVER).set_params(random_state=RESAMPLING_SEED)),
+                ('under', clone(UNDER).set_params(random_state=RESAMPLING_SEED))]
+
+    model = fit_from_study(study, search_space, classifier, MODEL_PRE, X_train, y_train,
+                           samplers=samplers, trial=trial)
+
+    path = save_model(model, args.study)
+
+    print(f"Trial {trial.number} {trial.params} -> {path}")
+
+    if not args.no_artifact:
+        metadata = {'study': args.study, 'storage': STORAGE_BACKEND, 'trial': trial.number,
+                    'params': trial.params, 'values': trial.values}
+        print(f"Artifact -> {export_artifact(model, args.study, metadata=metadata)}")
@@ -3,11 +3,23 @@ import pandas as pd
 import numpy as np
 from imblearn.pipeline import Pipeline as ImbPipeline
 from xgboost import XGBClassifier
-from sklearn.model_selection import cross_val_score
 from optuna.samplers import TPESampler
-from optuna_functions import search_space_xgboost, early_prune, optm_score
-
-from settings import MODEL_PRE, OVER, UNDER, RKF
+from optuna_functions import search_space_xgboost, optm_score
+
+from mineral_prospect.modeling.fold_cache import FoldCache
+from mineral_prospect.modeling.memo import ObjectiveMemo
+from mineral_prospect.modeling.oof import OOFStore
+from mineral_prospect.modeling.profiling import profiled, stage
+from mineral_prospect.modeling.resampling import CachedResampler
+from mineral_prospect.modeling.runner import optimize_in_processes
+from mineral_prospect.modeling.sampling import WindowedSampler, recorded
+from mineral_prospect.modeling.staged import (add_size_trials, cross_val_roc_auc_curve,
+                                                ensemble_sizes)
+from mineral_prospect.modeling.storage import get_storage, storage_url
+
+from settings import (MODEL_PRE, OVER, UNDER, RESAMPLING_SEED, RKF, PRUNER,
+                      CACHE_DIR, ENSEMBLE_SIZE_FRACTIONS, STOPPER, STORAGE_BACKEND,
+                      OOF_DIR)
 
 import warnings
 
@@ -19,46 +31,94 @@ warnings.filterwarnings(
 ##########################################################################################
 
 
-def objective(trial):
+def make_objective(X_train=None, y_train=None, cache_dir=CACHE_DIR, oof_dir=OOF_DIR):
+    # Loads the training set unless one is given (benchmarks pass synthetic data and no cache)
 
-    params = search_space_xgboost(trial)
+    if X_train is None:
+        X_train = pd.read_parquet("../../../../../data/interim/copper/X_train.parquet")
+        y_train = pd.read_parquet("../../../../../data/interim/copper/y_train_cat.parquet")
 
-    steps_list = [('preprocessor', MODEL_PRE),
-                  ('over', OVER),
-                  ('under', UNDER),
-                  ('classifier', XGBClassifier(**params))]
+    fold_cache = FoldCache(MODEL_PRE, X_train, y_train, cache_dir=cache_dir)
 
-    pipe = ImbPipeline(steps_list)
+    folds = fold_cache.split(RKF)
 
-    early_prune(pipe, X_train, y_train)
+    # SMOTE + RandomUnderSampler run once per fold, then are replayed by every trial
+    resampler = CachedResampler([('over', OVER), ('under', UNDER)], seed=RESAMPLING_SEED,
+                                cache_dir=cache_dir).precompute(folds)
 
-    scores = cross_val_score(pipe, X_train, y_train, cv=RKF, scoring="roc_auc")
+    # Configurations already evaluated in the study are not refitted
+    memo = ObjectiveMemo(fold_cache, RKF)
 
-    score1, score2 = optm_score(scores)
+    # Validation probabilities of the complete trials, for ensembles of the stored trials
+    oof = OOFStore(fold_cache, RKF, oof_dir) if oof_dir is not None else None
 
-    return score1, score2
+    def objective(trial):
 
+        with stage('suggest'):
+            params = search_space_xgboost(trial)
 
-if __name__ == "__main__":
+        # The preprocessor and the resampling are fitted once per fold and cached
+        steps_list = [('resample', resampler),
+                      ('classifier', XGBClassifier(**params))]
+
+        pipe = ImbPipeline(steps_list)
+
+        values = memo.lookup(trial, pipe)
+
+        if values is not None:
+            return values
+
+        # One fit per fold, scored at every size up to params['n_estimators']
+        sizes = ensemble_sizes(params['n_estimators'], ENSEMBLE_SIZE_FRACTIONS)
+
+        predictions = []
+
+        curves = cross_val_roc_auc_curve(pipe, folds, sizes, trial=trial, pruner=PRUNER,
+                                         predictions=predictions)
 
-    X_train = pd.read_parquet("../../../../../data/interim/copper/X_train.parquet")
-    y_train = pd.read_parquet("../../../../../data/interim/copper/y_train_cat.parquet")
+        score1, score2 = optm_score(curves[:, -1])
+
+        add_size_trials(trial, pipe, sizes, curves, optm_score, memo=memo)
+
+        if oof is not None:
+            oof.save(trial, predictions)
+
+        return score1, score2
+
+    # Wall/CPU time per stage, as the 'profile' user attribute of each trial; peak memory only
+    # every 100th trial, as tracemalloc slows the traced trials down. Sampling time and history
+    # size as the 'sampler' user attribute
+    return recorded(profiled(objective, memory=100))
+
+
+if __name__ == "__main__":
 
-    SAMPLER = TPESampler(
-        multivariate=True,
-        n_startup_trials=100,
-        group=True,
-        warn_independent_sampling=False,
-        n_ei_candidates=50,
-        constant_liar=True
+    STORAGE = storage_url("xgboost", STORAGE_BACKEND)
+
+    # TPE sees the last 1000 trials and 200 older ones spread over the objective ranking, fewer
+    # when a suggestion takes over 0.5 s; sampling times go to the 'sampler' user attribute
+    SAMPLER = WindowedSampler(
+        TPESampler(
+            multivariate=True,
+            n_startup_trials=100,
+            group=True,
+            warn_independent_sampling=False,
+            n_ei_candidates=50,
+            constant_liar=True
+        ),
+        window=1000,
+        n_quantiles=200,
+        time_budget=0.5,
     )
 
     study = optuna.create_study(
         directions=['maximize', 'minimize'],
-        storage='sqlite:///xgboost.db',
+        storage=get_storage(STORAGE),
         study_name="xgboost",
         load_if_exists=True,
         sampler=SAMPLER
     )
 
-    study.optimize(objective, n_trials=3500, n_jobs=-1)
+    optimize_in_processes(study.study_name, STORAGE, make_objective,
+                          n_trials=3500, sampler=SAMPLER, n_workers=-1,
+                          callbacks=[STOPPER])
@@ -1,25 +1,8 @@
 """Constants for copper data processing"""
 
-RENAME_DICT = {
-    'Property Name': 'PROPERTY_NM',
-    'Activity Status': 'ACTIVITY_STATUS',
-    'Mine Type 1': 'MINE_TYPE',
-    'Initial Capital Cost\r\n($M)': 'INITIAL_COST',
-    'NPV Discount % - Base Case\r\n(%)': 'NPV_DISCOUNT', 
-    'Post-Tax IRR % - Base Case\r\n(%)': 'TIR',
-    'Study Price per tonne - Base Case\r\n($/tonne)': 'PRICE_PER_TONNE_MAIN_ORE',
-    'Geologic Ore Body Type': 'GEOLOGIC_ORE_BODY_TYPE',
-    'Country / Region Name': 'PLACE_NM',
-    'Reserves & Resources: Ore Tonnage\r\n(tonnes)': 'ORE_TONNAGE',
-    'Grade, Reserves & Resources Copper\n(%)': 'COPPER_GRADE',
-    'Grade, Reserves & Resources Lead\n(%)': 'LEAD_GRADE',
-    'Grade, Reserves & Resources Zinc\n(%)': 'ZINC_GRADE',
-    'Grade, Reserves & Resources Gold\n(g/tonne)': 'GOLD_DENSITY',
-    'Grade, Reserves & Resources Silver\n(g/tonne)': 'SILVER_DENSITY',
-    'Global Region': 'GLOBAL_REGION',
-    }
-
-DROP_COLUMNS = ['PROPERTY_NM', 'ACTIVITY_STATUS', 'PLACE_NM', 'NPV_DISCOUNT']
+# Raw column names, cleaning, feature and target constants are shared with mineral_prospect.dataset
+from mineral_prospect.config import (RENAME_DICT, FILL_COLS, DROP_COLUMNS, TO_LOG10, LOG_INF_REPL,
+                                     MIN_TIR, UPPER_LIMIT_TIR)
 
 NUM_FEATURES = [
         "GOLD_DENSITY",
@@ -48,22 +31,6 @@ NUM_FEATURES = [
         'LOG_10_INITIAL_COST_PER_AMOUNT'
     ]
 
-TO_LOG10 = [
-    "GOLD_DENSITY",
-    "SILVER_DENSITY",
-    "PRECIOUS_ORE_DENSITY",
-    "COPPER_GRADE",
-    "INITIAL_COST",
-    "ORE_TONNAGE",
-    "PRECIOUS_GRAMS",
-    "COPPER_TONNAGE",
-    "ECONOMIC_AMOUNT",
-    "GOLD_GRAMS",
-    "SILVER_GRAMS",
-    'INITIAL_COST_PER_AMOUNT',
-
-]
-
 CAT_FEATURES = [
     "GEOLOGIC_ORE_BODY_TYPE",
     "GLOBAL_REGION",
@@ -71,12 +38,3 @@ CAT_FEATURES = [
 ]
 
 FEATURES = NUM_FEATURES + CAT_FEATURES
-
-FILL_COLS = ['COPPER_GRADE', 'LEAD_GRADE', 'ZINC_GRADE',
-       'GOLD_DENSITY', 'SILVER_DENSITY']
-
-LOG_INF_REPL = -100
-
-UPPER_LIMIT_TIR = 125
-
-MIN_TIR = 15
\ No newline at end of file